@@ -16,8 +16,30 @@ from io import BytesIO
 from PIL import Image
 import os
 import tempfile
-import requests
 import urllib.parse
+import secrets
+import time
+from contextlib import contextmanager
+from functools import partial, wraps
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+import async_engine
+import export_results
+import generation
+import instant_figure
+import metrics
+import packaging_text
+import pickup
+import postprocess
+import profiling
+import readiness
+import scheduler
+import upload_prep
+from fake_backend import FakeAsyncOpenAIClient, FakeOpenAIClient
+from generate_qr import make_qr_image
 
 # Import HEIC support
 try:
@@ -243,6 +265,40 @@ def init_session_state():
         st.session_state.accessory = ""
     if 'openai_client' not in st.session_state:
         st.session_state.openai_client = None
+    if 'upload_job' not in st.session_state:
+        st.session_state.upload_job = None
+    if 'upload_file_id' not in st.session_state:
+        st.session_state.upload_file_id = None
+    if 'lane' not in st.session_state:
+        st.session_state.lane = scheduler.DEFAULT_LANE
+    if 'retry_pending' not in st.session_state:
+        st.session_state.retry_pending = False
+    if 'reservation' not in st.session_state:
+        st.session_state.reservation = None
+    if 'reservation_code' not in st.session_state:
+        st.session_state.reservation_code = None
+    if 'kiosk_form_id' not in st.session_state:
+        st.session_state.kiosk_form_id = 0
+    if 'kiosk_last_pickup' not in st.session_state:
+        st.session_state.kiosk_last_pickup = None
+    if 'postprocess_job' not in st.session_state:
+        st.session_state.postprocess_job = None
+    if 'instant_requested' not in st.session_state:
+        st.session_state.instant_requested = False
+    if 'untitled_image' not in st.session_state:
+        st.session_state.untitled_image = None
+    if 'saved_image_path' not in st.session_state:
+        st.session_state.saved_image_path = None
+    if 'figures_generated' not in st.session_state:
+        st.session_state.figures_generated = 0
+    if 'variant_jobs' not in st.session_state:
+        st.session_state.variant_jobs = None
+    if 'variant_thumbnails' not in st.session_state:
+        st.session_state.variant_thumbnails = {}
+    if 'generation_error' not in st.session_state:
+        st.session_state.generation_error = None
+    if 'pending_generation' not in st.session_state:
+        st.session_state.pending_generation = None
 
 # ============================================================================
 # OPENAI API SETUP
@@ -250,50 +306,220 @@ def init_session_state():
 def setup_openai():
     """Configure OpenAI API with secrets management"""
     try:
-        # Get API key from secrets or environment
-        if hasattr(st, 'secrets') and 'openai' in st.secrets:
-            api_key = st.secrets['openai']['api_key']
-        elif os.getenv('OPENAI_API_KEY'):
-            api_key = os.getenv('OPENAI_API_KEY')
-        else:
-            return None
+        # Get API key from secrets or environment (a missing secrets.toml
+        # must not hide OPENAI_API_KEY)
+        api_key = get_secret('openai', 'api_key', 'OPENAI_API_KEY')
         
         if not api_key or not api_key.startswith('sk-'):
             return None
         
-        # Create OpenAI client with minimal configuration
-        client = OpenAI(api_key=api_key)
+        # Create OpenAI client with a pooled HTTP client that keeps warmed
+        # connections alive between the upload and the generate click
+        # max_retries=0: the generation job retries by error class instead
+        client = OpenAI(
+            api_key=api_key,
+            max_retries=0,
+            http_client=DefaultHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=100,
+                    max_keepalive_connections=20,
+                    keepalive_expiry=120
+                )
+            )
+        )
         return client
         
     except Exception as e:
         return None
 
+@st.cache_resource(show_spinner=False)
+def get_shared_openai_client():
+    """One OpenAI client (and connection pool) shared by every session"""
+    # Local stand-in for rehearsals and development (IMAGE_BACKEND=fake)
+    if os.getenv('IMAGE_BACKEND') == 'fake':
+        return FakeOpenAIClient(latency=float(os.getenv('FAKE_BACKEND_LATENCY', '5')))
+    
+    client = setup_openai()
+    if client is None:
+        # Raising keeps a missing key from being cached for the process lifetime
+        raise RuntimeError("OpenAI API key not configured")
+    return client
+
+def get_secret(section, key, env_name=None):
+    """Read a value from Streamlit secrets, falling back to an environment variable"""
+    try:
+        if hasattr(st, 'secrets') and section in st.secrets and key in st.secrets[section]:
+            return st.secrets[section][key]
+    except Exception:
+        # No secrets.toml at all - fall through to the environment
+        pass
+    if env_name:
+        return os.getenv(env_name)
+    return None
+
+# ============================================================================
+# GENERATION SCHEDULER
+# ============================================================================
+def use_async_engine():
+    """True when generation calls run on the shared asyncio engine (GENERATION_ENGINE=async)"""
+    return os.getenv('GENERATION_ENGINE', 'threads') == 'async'
+
+def create_async_client():
+    """Async client for the engine's event loop (called on the loop thread)"""
+    if os.getenv('IMAGE_BACKEND') == 'fake':
+        return FakeAsyncOpenAIClient(latency=float(os.getenv('FAKE_BACKEND_LATENCY', '5')))
+    
+    return AsyncOpenAI(
+        api_key=get_secret('openai', 'api_key', 'OPENAI_API_KEY'),
+        max_retries=0,
+        http_client=DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=500,
+                max_keepalive_connections=100,
+                keepalive_expiry=120
+            )
+        )
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_async_engine():
+    """One background event loop holding every in-flight generation call"""
+    return async_engine.AsyncGenerationEngine(
+        create_async_client,
+        max_in_flight=int(os.getenv('MAX_CONCURRENT_GENERATIONS', '200')),
+        retries=generation_retries()
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_scheduler():
+    """Process-wide scheduler that orders generation calls by priority lane"""
+    if use_async_engine():
+        # Jobs return Futures, so one dispatcher thread serves every slot
+        return scheduler.GenerationScheduler(
+            max_concurrent=int(os.getenv('MAX_CONCURRENT_GENERATIONS', '200')),
+            max_wait_seconds=int(os.getenv('MAX_QUEUE_WAIT_SECONDS', '600')),
+            worker_threads=1
+        )
+    return scheduler.GenerationScheduler(
+        max_concurrent=int(os.getenv('MAX_CONCURRENT_GENERATIONS', '8')),
+        max_wait_seconds=int(os.getenv('MAX_QUEUE_WAIT_SECONDS', '600'))
+    )
+
+def get_warm_up_engine():
+    """The asyncio engine when it is in use and a key is configured - its connection pool needs warming too"""
+    if use_async_engine() and st.session_state.openai_client is not None:
+        return get_async_engine()
+    return None
+
+def get_generation_call():
+    """Callable(png_bytes, prompt, on_partial=None) used by scheduler jobs"""
+    if use_async_engine():
+        call = get_async_engine().submit
+    else:
+        call = partial(generation.generate_with_retries, st.session_state.openai_client, retries=generation_retries())
+    # Sampled sessions also profile the call on its worker thread
+    if profiling_session():
+        return profiling.profiled(call, "generation")
+    return call
+
+def get_lane_tokens():
+    """Lane access tokens from secrets ([lanes] vip_token = ...) or LANE_TOKEN_VIP etc."""
+    return {
+        lane: get_secret('lanes', f"{lane}_token", f"LANE_TOKEN_{lane.upper()}")
+        for lane in scheduler.LANES
+    }
+
+def apply_query_params():
+    """Pick up priority lane and reservation code from the URL (?lane=vip&token=...)"""
+    params = st.query_params
+    st.session_state.lane = scheduler.resolve_lane(
+        params.get('lane'),
+        params.get('token'),
+        get_lane_tokens()
+    )
+    if params.get('reservation') and st.session_state.reservation_code is None:
+        st.session_state.reservation_code = params.get('reservation')
+
+def get_event_caption():
+    """Event name/date stamped on every figure ([event] in secrets or EVENT_NAME/EVENT_DATE)"""
+    event_name = get_secret('event', 'name', 'EVENT_NAME') or "Expect Miracles Foundation"
+    event_date = get_secret('event', 'date', 'EVENT_DATE')
+    if not event_date:
+        today = datetime.now()
+        event_date = f"{today:%B} {today.day}, {today.year}"
+    return postprocess.event_caption(event_name, event_date)
+
+def fallback_mode():
+    """
+    When to offer the instant CPU figure ([fallback] mode or FALLBACK_MODE)
+    
+    - 'offer' (default): a button when the API fails or the queue is full
+    - 'auto': use it automatically in those cases
+    - 'off': never
+    """
+    mode = str(get_secret('fallback', 'mode', 'FALLBACK_MODE') or 'offer').strip().lower()
+    return mode if mode in ('offer', 'auto', 'off') else 'offer'
+
+def local_titles_enabled():
+    """True when the model leaves the header blank and the app draws the name ([generation] local_titles or LOCAL_TITLES)"""
+    value = get_secret('generation', 'local_titles', 'LOCAL_TITLES')
+    return str(value).strip().lower() in ('1', 'true', 'yes')
+
+def generation_variants():
+    """Figures generated per upload for the pick-your-favourite grid ([generation] variants or GENERATION_VARIANTS)"""
+    try:
+        variants = int(get_secret('generation', 'variants', 'GENERATION_VARIANTS') or 1)
+    except (TypeError, ValueError):
+        variants = 1
+    return max(1, min(variants, generation.MAX_VARIANTS))
+
+def generation_retries():
+    """In-place retries of rate-limited, timed-out or server-failed calls ([generation] retries or GENERATION_RETRIES)"""
+    value = get_secret('generation', 'retries', 'GENERATION_RETRIES')
+    try:
+        # 0 is a valid setting (no retries), so only a missing value falls back
+        retries = generation.RETRY_LIMIT if value in (None, '') else int(value)
+    except (TypeError, ValueError):
+        retries = generation.RETRY_LIMIT
+    return max(0, min(retries, generation.MAX_RETRIES))
+
+def instant_figure_call(full_name, accessory):
+    """Callable(png_bytes, prompt) for pickup jobs that renders the instant figure instead of calling the API"""
+    def generate(png_bytes, prompt):
+        image_bytes = instant_figure.render_figure(Image.open(BytesIO(png_bytes)), full_name, accessory)
+        metrics.increment("instant_figures")
+        return png_data_url(image_bytes)
+    return generate
+
 # ============================================================================
 # IMAGE PROCESSING FUNCTIONS
 # ============================================================================
+def png_data_url(image_bytes):
+    """PNG bytes as a data URL, the same form the API's base64 results take"""
+    return f"data:image/png;base64,{base64.b64encode(image_bytes).decode()}"
+
 def image_to_base64(image):
     """Convert PIL Image to base64 string for API"""
     buffered = BytesIO()
     image.save(buffered, format="PNG")
     return base64.b64encode(buffered.getvalue()).decode()
 
-def save_generated_image(image_url, first_name):
+def saving_enabled():
+    """True when generated figures should be kept on disk for post-event export"""
+    value = get_secret('storage', 'save_images', 'SAVE_GENERATED_IMAGES')
+    return str(value).strip().lower() in ('1', 'true', 'yes')
+
+def save_generated_image(image_bytes, first_name, last_name="", accessory="", replaces=None):
     """
-    Save generated image locally with timestamp
-    Creates a 'generated_images' folder if it doesn't exist
+    Save generated image locally with timestamp (when saving is enabled)
+    Writes into the 'generated_images' folder with a manifest.csv for export_results.py;
+    replaces is the path of an earlier save of the same figure to drop
     """
+    if not saving_enabled():
+        return None
+    
     try:
-        # Create directory if it doesn't exist
-        if not os.path.exists('generated_images'):
-            os.makedirs('generated_images')
-        
-        # Generate filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"generated_images/{first_name}_{timestamp}.png"
-        
-        # Note: In production, you'd download the image from the URL
-        # For now, we'll just return the filename pattern
-        return filename
+        return export_results.save_result(image_bytes, first_name, last_name, accessory, replaces=replaces)
     except Exception as e:
         st.warning(f"Could not save image locally: {e}")
         return None
@@ -301,164 +527,137 @@ def save_generated_image(image_url, first_name):
 # ============================================================================
 # AI IMAGE GENERATION
 # ============================================================================
-def generate_superhero_image(uploaded_image, first_name, last_name, accessory):
+def submit_extra_variants(lane, png_bytes, prompt, count):
+    """Queue extra figures for the pick-your-favourite grid (skipped when the lane is already over its wait limit)"""
+    jobs = []
+    for _ in range(count):
+        if get_scheduler().estimate_wait(lane) > get_scheduler().max_wait_seconds:
+            metrics.increment("variants_skipped")
+            break
+        try:
+            jobs.append(get_scheduler().submit(lane, get_generation_call(), png_bytes, prompt))
+        except scheduler.AdmissionRejected:
+            metrics.increment("variants_skipped")
+            break
+    return jobs
+
+def first_success(jobs):
+    """The first finished job that did not fail, or None"""
+    for job in jobs:
+        if job.future.done() and not job.future.cancelled() and job.future.exception() is None:
+            return job
+    return None
+
+def submit_generation(uploaded_image, first_name, last_name, accessory, prepared_upload=None):
     """
-    Generate superhero action figure image using OpenAI gpt-image-1
+    Queue the action figure generation(s) and return without waiting
+    
+    The jobs go into st.session_state.pending_generation; step 3 polls them
+    from a fragment, so no script thread is held for the 60-90 second call.
     
     Parameters:
     - uploaded_image: PIL Image object
     - first_name: User's first name
     - last_name: User's last name (optional)
     - accessory: User-specified accessories/props
+    - prepared_upload: Payload prefetched by upload_prep (optional, prepared inline if missing)
     
     Returns:
-    - image_url: URL of generated image or None if failed
+    - True when queued; False when turned away with a reservation or failed
+      (st.session_state.reservation / generation_error says which)
     """
     
     # Get OpenAI client from session state
     if 'openai_client' not in st.session_state or st.session_state.openai_client is None:
-        st.error("OpenAI client not initialized")
-        return None
-    
-    client = st.session_state.openai_client
-    
-    # Build full name for display
-    if last_name.strip():
-        full_name = f"{first_name} {last_name}"
-    else:
-        full_name = first_name
+        st.session_state.generation_error = {"error_class": "config", "detail": "OpenAI client not initialized"}
+        return False
     
-    # Build accessories text based on user input
-    if accessory.strip():
-        accessories_text = f"Include accessories that represent: {accessory}. These should be neatly positioned in the packaging alongside the figure, looking professional and store-ready."
-    else:
-        accessories_text = "No additional accessories are needed - just the figure in confident heroic pose."
-    
-    # Create the enhanced prompt with new requirements
-    prompt = f"""Create a realistic, store-ready action figure of a person named {full_name}, based on the uploaded reference image. 
-The final result should look like a premium collectible toy photographed for retail blister packaging.
-
-CRITICAL REQUIREMENTS:
-- Make the photo look as realistic as possible while ensuring the final image is flattering and professional
-- Apply professional photo retouching techniques: optimize lighting, smooth skin naturally, enhance colors, and present the person in their most confident, flattering appearance
-- The figure should look polished and magazine-ready while preserving the person's authentic identity and characteristics
-- Focus on good posture, confident expression, and professional presentation
-- Use a VERTICAL HANGING BLISTER PACK format for the packaging
-- Generate a FULL-BODY action figure showing the person from head to toe, completely contained within the plastic packaging
-
-Packaging Design:
-- VERTICAL portrait orientation with rounded top corners and a hanging hole at the top center
-- The packaging has a clear plastic blister in front and a colorful printed backing card behind
-- The plastic blister must be tall enough to contain the ENTIRE action figure from head to feet with small margins
-- Deep PURPLE background (#7b2c85) as the primary color with BLUE accents on the backing card
-- The background features a bright blue-purple gradient with light rays, glowing energy effects, and star-like sparkles
-- Include small cancer awareness ribbon icons (teal and pink ribbons) subtly placed in the design
-- Large, bold title at top: "{full_name.upper()}: ACTION FIGURE" in bold comic-style lettering with metallic blue chrome effect and depth/shadow
-- Below that: "I'M TAKING ACTION AGAINST CANCER" in large white bold comic-style letters
-- Include "Expect Miracles" in elegant italic script below the main message
-- The plastic blister should have realistic transparency with subtle highlights and reflections showing the contours of the figure inside
-- Add small "Ages 8+" text and a fictional brand logo in bottom corners for authenticity
-- The font on the backing card should be bold comic-style lettering throughout
-
-Action Figure Details:
-- Show {full_name} as a highly detailed 6-inch scale FULL-BODY action figure inside the clear plastic bubble
-- The figure must be completely visible from head to toe - showing face, torso, legs, and feet
-- Maintain exact facial likeness from the uploaded photo - this is critical
-- The figure should be standing in a natural, confident pose with excellent posture
-- Position the figure centered vertically in the packaging with the head near the top and feet near the bottom
-- Keep them in their actual clothing from the reference photo (business casual, professional attire) - show the complete outfit
-- Include realistic fabric textures, creases, and details on the clothing from head to toe
-- {accessories_text}
-- The accessories should be visible inside the packaging alongside the figure
-- Ensure accurate representation of gender, ethnicity, hair color/style, and all physical characteristics from the reference image
-- Present the figure in the most flattering, confident way possible while maintaining authentic likeness
-- The entire figure (head, body, legs, feet) must fit within the plastic blister boundaries
-
-Photography & Lighting:
-- Professional product photography against a neutral light background (off-white or light gray)
-- Even, soft studio lighting with minimal harsh shadows that naturally flatters the figure
-- Realistic plastic blister reflections and highlights
-- The figure should be well-lit inside the packaging with clear visibility from head to toe
-- Clean, sharp focus throughout - catalog-quality product shot
-- Slight shadow beneath the package to ground it realistically
-- Professional lighting that enhances features and creates a polished, magazine-quality appearance
-- Ensure the full body is evenly lit and clearly visible
-
-Overall Style:
-- Modern collectible toy aesthetic (2020s style, not vintage 1980s)
-- The package should look clean, professional, and ready for retail display
-- Purple and blue color palette throughout, with purple as dominant color
-- Photorealistic finish - should look like an actual product you could buy
-- Make the figure flattering and magazine-ready while maintaining authentic likeness to the reference photo
-- The overall feeling should be inspiring, professional, and polished
-- Everyone should feel proud and excited to share their action figure on social media
-- The complete action figure from head to toe should be the focal point of the image"""
+    # Build full name for display and the prompt
+    full_name = generation.build_full_name(first_name, last_name)
+    prompt = generation.build_prompt(full_name, accessory, blank_title=local_titles_enabled())
     
     try:
-        # Convert PIL Image to bytes for upload with proper format
-        import io
-        img_byte_arr = io.BytesIO()
+        # Use the payload prepared in the background during steps 1-2
+        if prepared_upload is None:
+            prepared_upload = upload_prep.prepare_image(uploaded_image)
         
-        # Convert to RGB if needed (removes alpha channel)
-        if uploaded_image.mode == 'RGBA':
-            uploaded_image = uploaded_image.convert('RGB')
+        # A retry after an API error jumps ahead of first-time requests
+        lane = "retry" if st.session_state.retry_pending else st.session_state.lane
         
-        # Save as PNG
-        uploaded_image.save(img_byte_arr, format='PNG')
-        img_byte_arr.seek(0)
+        # Preview frames streamed from the API (kept only until the final image arrives)
+        frames = generation.PartialFrames()
+        on_partial = frames.push if os.getenv('STREAM_PREVIEWS', '1') == '1' else None
         
-        # Give the BytesIO object a name attribute so the API recognizes it as a PNG file
-        img_byte_arr.name = "uploaded_image.png"
-        
-        # Show progress to user
-        with st.spinner("🦸 Transforming you into an action figure... This may take 60-90 seconds..."):
-            # Call OpenAI gpt-image-1 API with image editing
-            response = client.images.edit(
-                model="gpt-image-1",
-                image=img_byte_arr,
-                prompt=prompt,
-                size="1024x1536",
-                n=1
+        # Queue the call - the scheduler decides who goes next under load
+        try:
+            job = get_scheduler().submit(
+                lane,
+                get_generation_call(),
+                prepared_upload["png_bytes"],
+                prompt,
+                on_partial=on_partial,
+                reservation_code=st.session_state.reservation_code
             )
-            
-            # Extract image from response
-            image_url = None
-            
-            if hasattr(response.data[0], 'url') and response.data[0].url:
-                image_url = response.data[0].url
-            elif hasattr(response.data[0], 'b64_json') and response.data[0].b64_json:
-                # Convert base64 to data URL
-                image_base64 = response.data[0].b64_json
-                image_url = f"data:image/png;base64,{image_base64}"
-            
-            if not image_url:
-                st.error("❌ Could not extract image from response")
-                return None
-            
-            # Save image reference
-            save_generated_image(image_url, first_name)
-            
-            return image_url
-            
-    except Exception as e:
-        st.error(f"⚠️ Image Generation Error: {str(e)}")
+        except scheduler.ReservationNotDue as e:
+            # Back too early - show the same code again with its due time
+            st.session_state.reservation = dict(e.reservation, early=True)
+            return False
+        except scheduler.AdmissionRejected as e:
+            # Too busy - hand out a reservation instead of an unbounded wait
+            st.session_state.reservation = e.reservation
+            return False
         
-        # Show full error details
-        st.markdown("### 🔍 Error Details:")
-        import traceback
-        error_details = traceback.format_exc()
-        st.code(error_details, language="python")
+        st.session_state.retry_pending = False
+        st.session_state.reservation_code = None
         
-        # Show debugging info
-        st.markdown("### 🐛 Debug Information:")
-        st.write(f"- First Name: {first_name}")
-        st.write(f"- Last Name: {last_name}")
-        st.write(f"- Full Name: {full_name}")
-        st.write(f"- Accessory: {accessory}")
-        st.write(f"- Image Mode: {uploaded_image.mode}")
-        st.write(f"- Image Size: {uploaded_image.size}")
+        # Extra variants run in parallel - one round trip instead of serial retries
+        jobs = [job] + submit_extra_variants(lane, prepared_upload["png_bytes"], prompt, generation_variants() - 1)
+        metrics.increment("variants_requested", len(jobs))
         
+        st.session_state.pending_generation = {
+            "jobs": jobs,
+            "frames": frames,
+            "submitted_at": time.perf_counter(),
+            "frames_shown": 0,
+        }
+        return True
+            
+    except Exception as e:
+        record_generation_error(e)
+        return False
+
+def generation_finished(pending):
+    """True once any job succeeded or every job is done"""
+    jobs = pending["jobs"]
+    return first_success(jobs) is not None or all(job.future.done() for job in jobs)
+
+def collect_generation():
+    """
+    Take the result of the finished pending generation out of session state
+    
+    Returns:
+    - image_url: URL of the generated image or None if failed
+      (with several variants, the first to finish; all of them are left in
+      st.session_state.variant_jobs for the pick grid)
+    """
+    jobs = st.session_state.pending_generation["jobs"]
+    st.session_state.pending_generation = None
+    try:
+        # Raises the first job's error only when every variant failed
+        image_url = (first_success(jobs) or jobs[0]).future.result()
+    except Exception as e:
+        # Transient failures were already retried inside the job - step 3 shows a compact status
+        record_generation_error(e)
         return None
+    st.session_state.variant_jobs = jobs if len(jobs) > 1 else None
+    return image_url
+
+def record_generation_error(error):
+    """Keep the class and a one-line summary of a failed generation for step 3 (not the traceback)"""
+    st.session_state.generation_error = {
+        "error_class": generation.classify_error(error),
+        "detail": f"{type(error).__name__}: {str(error)[:300]}",
+    }
 
 # ============================================================================
 # UI COMPONENTS
@@ -544,11 +743,74 @@ def render_footer():
     </div>
     """, unsafe_allow_html=True)
 
+# ============================================================================
+# RERUN MEASUREMENT
+# ============================================================================
+def measuring_reruns():
+    """True when per-rerun CPU time and payload size are recorded (MEASURE_RERUNS=1)"""
+    return os.getenv('MEASURE_RERUNS') == '1'
+
+@contextmanager
+def measure_rerun(scope):
+    """
+    Record server CPU time and bytes sent to the browser for one rerun
+    
+    Only the outermost scope records: a full rerun is counted as 'app', a
+    fragment-only rerun under the fragment's own name. Samples appear in the
+    operator panel as rerun_cpu.<scope> (seconds) and rerun_bytes.<scope>.
+    """
+    ctx = get_script_run_ctx()
+    if not measuring_reruns() or ctx is None or getattr(ctx, 'rerun_meter_active', False):
+        yield
+        return
+    
+    sent = [0]
+    enqueue = ctx._enqueue
+    
+    def counting_enqueue(msg):
+        sent[0] += msg.ByteSize()
+        enqueue(msg)
+    
+    ctx._enqueue = counting_enqueue
+    ctx.rerun_meter_active = True
+    start = time.thread_time()
+    try:
+        yield
+    finally:
+        ctx._enqueue = enqueue
+        ctx.rerun_meter_active = False
+        metrics.record_sample(f"rerun_cpu.{scope}", time.thread_time() - start)
+        metrics.record_sample(f"rerun_bytes.{scope}", sent[0])
+
+def measured_fragment(run_every=None):
+    """st.fragment that also records (and, for sampled sessions, profiles) its own reruns under the function's name"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with measure_rerun(func.__name__), profiling.profile(func.__name__, profiling_session()):
+                return func(*args, **kwargs)
+        return st.fragment(wrapper, run_every=run_every)
+    return decorator
+
+def profiling_session():
+    """True when this session is profiled - sampled by PROFILE_SAMPLE_RATE or switched on in the operator panel"""
+    if 'profiled' not in st.session_state:
+        st.session_state.profiled = profiling.sample_session()
+    return st.session_state.profiled
+
 # ============================================================================
 # MAIN APP STEPS
 # ============================================================================
+def uploaded_thumbnail(image):
+    """Pre-encoded preview from the upload job when ready, so reruns don't re-encode the photo"""
+    job = st.session_state.upload_job
+    if job is not None and job.done() and job.exception() is None:
+        return job.result()["preview_bytes"]
+    return image
+
+@measured_fragment()
 def step_1_upload():
-    """Step 1: Photo Upload"""
+    """Step 1: Photo Upload (a fragment - uploading only reruns this step)"""
 
     st.markdown("### 📸 Step 1: Upload Your Photo")
     st.markdown("Choose a clear photo of yourself for the best action figure transformation")
@@ -574,6 +836,13 @@ def step_1_upload():
     )
     
     if uploaded_file is not None:
+        # Start preparing the API payload in the background right away -
+        # it only depends on the photo, not on the details entered in step 2
+        if st.session_state.upload_file_id != uploaded_file.file_id:
+            st.session_state.upload_file_id = uploaded_file.file_id
+            st.session_state.upload_job = upload_prep.submit_prepare(uploaded_file.getvalue())
+            upload_prep.warm_up_connection(st.session_state.openai_client, get_warm_up_engine())
+        
         try:
             # Display the uploaded image
             image = Image.open(uploaded_file)
@@ -582,7 +851,7 @@ def step_1_upload():
             if image.mode not in ('RGB', 'RGBA'):
                 image = image.convert('RGB')
             
-            st.image(image, caption="Your Photo", use_container_width=True)
+            st.image(uploaded_thumbnail(image), caption="Your Photo", use_container_width=True)
             
             # Store in session state
             st.session_state.uploaded_image = image
@@ -607,7 +876,16 @@ def step_2_details():
     if st.session_state.uploaded_image:
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
-            st.image(st.session_state.uploaded_image, caption="Your Photo", width=200)
+            st.image(uploaded_thumbnail(st.session_state.uploaded_image), caption="Your Photo", width=200)
+    
+    # Typing only reruns the form below, not the header, CSS and thumbnail
+    step_2_form()
+    
+    st.markdown('</div>', unsafe_allow_html=True)
+
+@measured_fragment()
+def step_2_form():
+    """Step 2 name and accessory inputs with the navigation buttons"""
     
     # Name input fields - First and Last name side by side
     col1, col2 = st.columns(2)
@@ -662,62 +940,358 @@ def step_2_details():
                 st.session_state.first_name = first_name
                 st.session_state.last_name = last_name
                 st.session_state.accessory = accessory
+                st.session_state.generation_error = None
                 st.session_state.step = 3
                 st.rerun()
+
+def render_reservation_notice():
+    """Show the 'come back in N minutes' notice for a queue reservation"""
+    reservation = st.session_state.reservation
+    if reservation.get('early'):
+        due = datetime.fromtimestamp(reservation['ready_at'])
+        st.warning(f"⏳ Your reservation isn't due yet - please come back at **{due:%H:%M}** (about {reservation['minutes']} minutes). You keep your place in line.")
+    else:
+        st.warning(f"⏳ We're very busy right now! Please come back in about **{reservation['minutes']} minutes**.")
+    st.info(f"🎟️ Your reservation code is **{reservation['code']}** - your photo and details are saved, just tap the button below when you're back.")
     
-    st.markdown('</div>', unsafe_allow_html=True)
+    if st.button("🚀 I'm Back - Generate Now", key="redeem_reservation"):
+        st.session_state.reservation_code = reservation['code']
+        st.session_state.reservation = None
+        st.rerun()
+
+def track_regeneration(local_title, variants=1):
+    """
+    Count figures and regenerations per title mode and variants per upload
+    
+    Any further figure from the same phone session counts as a regeneration -
+    usually a misspelled name or a disliked result - so the modes can be compared.
+    """
+    for mode in ("local_titles" if local_title else "model_titles", f"variants_{variants}"):
+        metrics.increment(f"figures.{mode}")
+        if st.session_state.figures_generated:
+            metrics.increment(f"regenerations.{mode}")
+    st.session_state.figures_generated += 1
+
+def complete_generation(image_url, image_bytes=None, local_title=False):
+    """
+    Store a finished figure, start saving and post-processing, and move to step 4
+    
+    With local_title the figure came back with a blank header: the original is
+    kept for name corrections and the lettering is drawn on here.
+    """
+    st.session_state.generated_image_url = image_url
+    st.session_state.generation_error = None
+    st.session_state.untitled_image = None
+    st.session_state.saved_image_path = None
+    
+    # Start stamping and share formats while step 4 renders
+    try:
+        image_bytes = image_bytes or generation.fetch_image_bytes(image_url)
+        if local_title:
+            st.session_state.untitled_image = image_bytes
+            full_name = generation.build_full_name(st.session_state.first_name, st.session_state.last_name)
+            try:
+                image_bytes = packaging_text.titled_png(image_bytes, full_name)
+                st.session_state.generated_image_url = png_data_url(image_bytes)
+            except Exception:
+                # Show the blank-header figure rather than nothing
+                metrics.increment("packaging_text_failed")
+        st.session_state.downloaded_image = image_bytes
+        st.session_state.saved_image_path = save_generated_image(
+            st.session_state.downloaded_image,
+            st.session_state.first_name,
+            st.session_state.last_name,
+            st.session_state.accessory
+        )
+        st.session_state.postprocess_job = postprocess.submit(
+            st.session_state.downloaded_image,
+            get_event_caption()
+        )
+    except Exception:
+        # Step 4 retries the download and offers the original image
+        st.session_state.postprocess_job = None
+    
+    st.session_state.step = 4
+    st.rerun()
+
+def create_instant_figure(prepared_upload=None):
+    """Render the CPU fallback figure from the session's photo and details, then go to step 4"""
+    if prepared_upload is None:
+        if st.session_state.upload_job is not None:
+            prepared_upload = upload_prep.wait_for_prepared(st.session_state.upload_job)
+        else:
+            prepared_upload = upload_prep.prepare_image(st.session_state.uploaded_image)
+    
+    full_name = generation.build_full_name(st.session_state.first_name, st.session_state.last_name)
+    image_bytes = instant_figure.render_figure(prepared_upload["image"], full_name, st.session_state.accessory)
+    metrics.increment("instant_figures")
+    
+    st.session_state.reservation = None
+    st.session_state.retry_pending = False
+    complete_generation(png_data_url(image_bytes), image_bytes)
+
+def render_instant_figure_offer(key):
+    """Offer the instant figure while the AI is unavailable (unless FALLBACK_MODE=off)"""
+    if fallback_mode() == 'off':
+        return
+    
+    st.markdown("**⚡ Don't want to wait?** Get an instant action figure right now - made on the spot without AI.")
+    # A callback, so the next rerun renders the figure before retrying the API
+    st.button("⚡ Get My Instant Figure", key=key, on_click=request_instant_figure)
+
+def request_instant_figure():
+    """Button callback: make the instant figure on the next run of step 3"""
+    st.session_state.instant_requested = True
+
+@measured_fragment(run_every=1)
+def render_generation_progress():
+    """Queue position, then sneak-peek frames, until the generation finishes and the page reruns"""
+    pending = st.session_state.pending_generation
+    if pending is None or generation_finished(pending):
+        st.rerun(scope="app")
+    
+    job = pending["jobs"][0]
+    if job.started_at is None:
+        position = get_scheduler().position(job)
+        st.info(f"⏳ You're #{position + 1} in line - your action figure will start shortly...")
+        return
+    
+    st.info("🦸 Transforming you into an action figure... This may take 60-90 seconds...")
+    frame_count, frame = pending["frames"].latest()
+    if frame is not None:
+        if pending["frames_shown"] == 0:
+            metrics.record_timing("first_preview", time.perf_counter() - pending["submitted_at"])
+        pending["frames_shown"] = frame_count
+        st.image(frame, caption="✨ Sneak peek - adding the finishing touches...", use_container_width=True)
 
 def step_3_generate():
     """Step 3: Generate Action Figure Image"""
     
+    # Attendee chose the instant figure over waiting for the API
+    if st.session_state.generated_image_url is None and st.session_state.instant_requested:
+        st.session_state.instant_requested = False
+        create_instant_figure()
+    
+    # Waiting on a reservation - don't resubmit on every rerun
+    if st.session_state.generated_image_url is None and st.session_state.reservation is not None:
+        st.markdown("### ⏳ Almost Your Turn...")
+        render_reservation_notice()
+        render_instant_figure_offer("instant_from_reservation")
+    
+    # Last attempt failed for good - likewise, wait for the attendee to choose
+    elif st.session_state.generated_image_url is None and st.session_state.generation_error is not None:
+        st.markdown("### 😕 We Couldn't Create Your Figure")
+        render_generation_error(st.session_state.generation_error)
+    
+    # Generation queued - poll it without holding this script thread
+    elif st.session_state.generated_image_url is None and st.session_state.pending_generation is not None:
+        st.markdown("### ⚡ Generating Your Action Figure...")
+        if generation_finished(st.session_state.pending_generation):
+            finish_generation(collect_generation())
+        else:
+            render_generation_progress()
+    
     # Auto-generate if not already generated
-    if st.session_state.generated_image_url is None:
+    elif st.session_state.generated_image_url is None:
         st.markdown("### ⚡ Generating Your Action Figure...")
         
         # Generate the image
         try:
-            image_url = generate_superhero_image(
+            # Collect the payload prepared in the background since step 1
+            prepared_upload = None
+            if st.session_state.upload_job is not None:
+                try:
+                    prepared_upload = upload_prep.wait_for_prepared(st.session_state.upload_job)
+                except ValueError as e:
+                    # Photo failed validation (e.g. too small) - send them back to step 1
+                    st.error(f"⚠️ {e}")
+                    if st.button("⬅️ Back to Photo", key="back_to_photo_invalid"):
+                        st.session_state.step = 1
+                        st.rerun()
+                    return
+            
+            # No API configured - degrade straight to the instant figure
+            if st.session_state.openai_client is None and fallback_mode() == 'auto':
+                create_instant_figure(prepared_upload)
+            
+            submitted = submit_generation(
                 st.session_state.uploaded_image,
                 st.session_state.first_name,
                 st.session_state.last_name,
-                st.session_state.accessory
+                st.session_state.accessory,
+                prepared_upload=prepared_upload
             )
             
-            if image_url:
-                st.session_state.generated_image_url = image_url
-                st.session_state.step = 4
-                st.rerun()
+            if submitted:
+                render_generation_progress()
             else:
-                # Error occurred - the error details should have been shown
-                st.error("❌ Generation returned no image. Check error details above.")
-                
-                col1, col2 = st.columns(2)
-                with col1:
-                    if st.button("🔄 Try Again", key="retry_generation"):
-                        st.rerun()
-                with col2:
-                    if st.button("⬅️ Back to Details", key="back_to_details_from_error"):
-                        st.session_state.step = 2
-                        st.rerun()
+                finish_generation(None, prepared_upload)
         except Exception as e:
-            st.error(f"❌ Critical error during generation: {e}")
-            import traceback
-            st.code(traceback.format_exc())
-            
-            col1, col2 = st.columns(2)
-            with col1:
-                if st.button("🔄 Try Again", key="retry_generation_exception"):
-                    st.rerun()
-            with col2:
-                if st.button("⬅️ Back to Details", key="back_to_details_exception"):
-                    st.session_state.step = 2
-                    st.rerun()
+            record_generation_error(e)
+            render_generation_error(st.session_state.generation_error)
     
     st.markdown('</div>', unsafe_allow_html=True)
 
+def finish_generation(image_url, prepared_upload=None):
+    """Move on from step 3 with a generated figure, or show the reservation, fallback or error"""
+    if image_url:
+        local_title = local_titles_enabled()
+        jobs = st.session_state.variant_jobs
+        track_regeneration(local_title, len(jobs) if jobs else 1)
+        if jobs:
+            # Several variants - step 4 lets the attendee pick one
+            st.session_state.step = 4
+            st.rerun()
+        complete_generation(image_url, local_title=local_title)
+    elif fallback_mode() == 'auto':
+        # Queue full or API failing - nobody leaves empty-handed
+        create_instant_figure(prepared_upload)
+    elif st.session_state.reservation is not None:
+        # Admission control turned us away - show the reservation
+        render_reservation_notice()
+        render_instant_figure_offer("instant_from_queue")
+    else:
+        # Generation failed after any retries - show why without resubmitting
+        render_generation_error(st.session_state.generation_error)
+
+def render_generation_error(error):
+    """
+    Compact status for a failed generation, with the next steps that can help
+    
+    Parameters:
+    - error: dict from record_generation_error() (the one-line detail is shown to operators only)
+    """
+    messages = {
+        "rate_limit": "⏳ The image service is very busy right now. Please try again in a minute.",
+        "timeout": "📡 The image service took too long to answer. Please try again.",
+        "server": "⚠️ The image service had a hiccup. Please try again.",
+        "content_policy": "🚫 The image service couldn't use this photo or accessory. Please try a different photo or accessory.",
+        "bad_input": "🖼️ The image service couldn't use this photo. Please try a different one.",
+        "config": "🛠️ The image service isn't available right now. Please ask a staff member.",
+    }
+    st.error(messages[error['error_class']])
+    if is_operator():
+        st.caption(error['detail'])
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        if generation.ERROR_CLASSES[error['error_class']]['transient']:
+            # Same photo and details, ahead of first-time requests
+            if st.button("🔄 Try Again", key="retry_generation"):
+                st.session_state.generation_error = None
+                st.session_state.retry_pending = True
+                st.rerun()
+        elif error['error_class'] in ("content_policy", "bad_input"):
+            if st.button("📸 Use Another Photo", key="back_to_photo_from_error"):
+                st.session_state.generation_error = None
+                st.session_state.step = 1
+                st.rerun()
+    with col2:
+        if st.button("⬅️ Back to Details", key="back_to_details_from_error"):
+            st.session_state.generation_error = None
+            st.session_state.step = 2
+            st.rerun()
+    
+    render_instant_figure_offer("instant_from_error")
+
+@measured_fragment(run_every=2)
+def render_share_formats_pending(job):
+    """Poll the post-processing job, then rerun the page to show its downloads"""
+    if job.done():
+        st.rerun()
+    st.caption("🎨 Preparing Instagram and story formats...")
+
+def render_variant_downloads(job, first_name, key_prefix):
+    """Download buttons for the stamped share variants"""
+    if not job.done():
+        render_share_formats_pending(job)
+        return
+    
+    # Post-processing is optional - the original download still works
+    if job.exception() is not None:
+        return
+    
+    variants = job.result()
+    st.markdown("#### 📐 Share Formats")
+    fmt = st.radio("File format", list(postprocess.FORMATS), horizontal=True, key=f"{key_prefix}_format")
+    _, mime, extension = postprocess.FORMATS[fmt]
+    
+    columns = st.columns(len(postprocess.VARIANTS))
+    for column, (variant, (_, _, label)) in zip(columns, postprocess.VARIANTS.items()):
+        with column:
+            st.download_button(
+                label=f"💾 {label}",
+                data=variants[variant][fmt],
+                file_name=f"{first_name}_action_figure_{variant}.{extension}",
+                mime=mime,
+                key=f"{key_prefix}_{variant}",
+                on_click="ignore",
+                use_container_width=True
+            )
+
+@measured_fragment(run_every=2)
+def render_variant_pending(index, job):
+    """Poll one variant, then rerun the page to add it to the grid"""
+    if job.future.done():
+        st.rerun()
+    st.info(f"⏳ Option {index + 1} is still being created...")
+
+def variant_thumbnail(index, image_url):
+    """Small JPEG of a variant for the pick grid (made once per variant)"""
+    thumbnails = st.session_state.variant_thumbnails
+    if index not in thumbnails:
+        image = Image.open(BytesIO(generation.fetch_image_bytes(image_url))).convert("RGB")
+        image.thumbnail((512, 768))
+        buffered = BytesIO()
+        image.save(buffered, format="JPEG", quality=85)
+        thumbnails[index] = buffered.getvalue()
+    return thumbnails[index]
+
+def drop_variants():
+    """Cancel variants still waiting for a worker and clear the pick grid"""
+    for job in st.session_state.variant_jobs or []:
+        job.future.cancel()
+    st.session_state.variant_jobs = None
+    st.session_state.variant_thumbnails = {}
+
+def pick_variant(index):
+    """Keep the chosen variant and drop the others; only it is saved and post-processed"""
+    image_url = st.session_state.variant_jobs[index].future.result()
+    metrics.increment(f"variant_picked.{index}")
+    drop_variants()
+    
+    complete_generation(image_url, local_title=local_titles_enabled())
+
+def render_variant_picker():
+    """Grid of variants that fills in as they finish, with a pick button for each"""
+    st.markdown("### ⭐ Pick Your Favourite!")
+    if local_titles_enabled():
+        st.markdown("**We made a few versions for you - your name goes on the one you choose.**")
+    else:
+        st.markdown("**We made a few versions for you - choose the one you like best.**")
+    
+    jobs = st.session_state.variant_jobs
+    columns = st.columns(2)
+    for index, job in enumerate(jobs):
+        with columns[index % 2]:
+            if not job.future.done():
+                render_variant_pending(index, job)
+            elif job.future.cancelled() or job.future.exception() is not None:
+                st.warning(f"⚠️ Option {index + 1} didn't work out")
+            else:
+                st.image(variant_thumbnail(index, job.future.result()), caption=f"Option {index + 1}", use_container_width=True)
+                if st.button("⭐ Pick This One", key=f"pick_variant_{index}", use_container_width=True):
+                    pick_variant(index)
+
 def step_4_share():
     """Step 4: Display and Share Results"""
     
+    # Several variants came back - the attendee picks one first
+    if st.session_state.variant_jobs is not None:
+        render_variant_picker()
+        st.markdown('</div>', unsafe_allow_html=True)
+        return
+    
     # Build display name
     if st.session_state.last_name.strip():
         display_name = f"{st.session_state.first_name} {st.session_state.last_name}"
@@ -729,125 +1303,491 @@ def step_4_share():
     
     # Display the generated image
     if st.session_state.generated_image_url:
+        # Bytes go through Streamlit's media endpoint once (kept as PNG so
+        # reruns don't transcode); the base64 data URL would be re-sent
+        # inside the page on every rerun
         st.image(
-            st.session_state.generated_image_url,
+            st.session_state.get('downloaded_image') or st.session_state.generated_image_url,
             caption=f"{display_name} - Cancer Fighting Action Figure",
+            output_format="PNG",
             use_container_width=True
         )
-                
-        # Action buttons
-        st.markdown("### 📤 Save & Share Your Action Figure")
         
-        # MOBILE-FRIENDLY DOWNLOAD SECTION
-        # Prepare image data for both download methods
-        try:
-            # Prepare image data if not already done
-            if 'downloaded_image' not in st.session_state:
-                image_data = None
-                
-                # Check if it's a data URL (base64)
-                if st.session_state.generated_image_url.startswith('data:image'):
-                    # Extract base64 data from data URL
-                    base64_data = st.session_state.generated_image_url.split(',', 1)[1]
-                    image_data = base64.b64decode(base64_data)
-                    st.session_state.downloaded_image = image_data
-                else:
-                    # It's a regular URL - download it
-                    with st.spinner("Preparing download..."):
-                        response = requests.get(st.session_state.generated_image_url, timeout=10)
-                        response.raise_for_status()
-                        st.session_state.downloaded_image = response.content
+        # Downloads, formats and sharing rerun on their own
+        step_4_actions()
+    
+    st.markdown('</div>', unsafe_allow_html=True)
+
+def render_name_correction():
+    """Let the attendee fix the name on the packaging by redrawing the lettering locally"""
+    with st.expander("✏️ Name not quite right? Fix it here"):
+        col1, col2 = st.columns(2)
+        with col1:
+            first_name = st.text_input("First Name", value=st.session_state.first_name, key="fix_first_name")
+        with col2:
+            last_name = st.text_input("Last Name (Optional)", value=st.session_state.last_name, key="fix_last_name")
+        
+        if st.button("✏️ Update My Name", key="fix_name", use_container_width=True):
+            if not first_name.strip():
+                st.error("⚠️ Please enter your first name")
+                return
             
-            # Convert image data to base64 for mobile display
-            img_base64 = base64.b64encode(st.session_state.downloaded_image).decode()
+            # Same name on the packaging - nothing to redraw, save or count
+            full_name = generation.build_full_name(first_name, last_name)
+            if full_name == generation.build_full_name(st.session_state.first_name, st.session_state.last_name):
+                st.info("✅ That's the name already on your figure")
+                return
             
-            # METHOD 1: Standard download button (works on desktop and some mobile browsers)
-            st.download_button(
-                label="💾 Download Image (Desktop/Android)",
-                data=st.session_state.downloaded_image,
-                file_name=f"{st.session_state.first_name}_action_figure.png",
-                mime="image/png",
-                key="download_image",
-                use_container_width=True
+            st.session_state.first_name = first_name
+            st.session_state.last_name = last_name
+            image_bytes = packaging_text.titled_png(st.session_state.untitled_image, full_name)
+            st.session_state.generated_image_url = png_data_url(image_bytes)
+            st.session_state.downloaded_image = image_bytes
+            # Replace the earlier save so the export lists the attendee once
+            st.session_state.saved_image_path = save_generated_image(
+                image_bytes, first_name, last_name, st.session_state.accessory,
+                replaces=st.session_state.saved_image_path
             )
+            st.session_state.postprocess_job = postprocess.submit(image_bytes, get_event_caption())
+            metrics.increment("regenerations_avoided")
             
-            st.caption("💡 **Tip:** If the download buttons don't work on your device, use the 'tap and hold' method above - it works on all iPhones!")
-            
-        except Exception as e:
-            st.error(f"⚠️ Unable to prepare download: {str(e)[:100]}")
-            st.markdown("**📱 Manual Save Method:**")
-            st.info("Tap and hold on the image above, then select 'Add to Photos' or 'Save Image'")
+            # The figure is shown outside this fragment
+            st.rerun(scope="app")
+
+@measured_fragment()
+def step_4_actions():
+    """Step 4 download, share-format and social buttons"""
+    
+    # Action buttons
+    st.markdown("### 📤 Save & Share Your Action Figure")
+    
+    # MOBILE-FRIENDLY DOWNLOAD SECTION
+    # Prepare image data for both download methods
+    try:
+        # Prepare image data if not already done
+        if 'downloaded_image' not in st.session_state:
+            with st.spinner("Preparing download..."):
+                st.session_state.downloaded_image = generation.fetch_image_bytes(st.session_state.generated_image_url)
         
-        st.markdown("---")
+        # METHOD 1: Standard download button (works on desktop and some mobile browsers)
+        st.download_button(
+            label="💾 Download Image (Desktop/Android)",
+            data=st.session_state.downloaded_image,
+            file_name=f"{st.session_state.first_name}_action_figure.png",
+            mime="image/png",
+            key="download_image",
+            on_click="ignore",
+            use_container_width=True
+        )
+        
+        st.caption("💡 **Tip:** If the download buttons don't work on your device, use the 'tap and hold' method above - it works on all iPhones!")
+        
+        # Name lettering was drawn by the app - fixing it needs no new generation
+        if st.session_state.untitled_image is not None:
+            render_name_correction()
         
-        # LinkedIn Direct Share Button
-        st.markdown("### 📱 Share on Social Media")
+        # Stamped share formats from the post-processing pool
+        if st.session_state.postprocess_job is not None:
+            render_variant_downloads(
+                st.session_state.postprocess_job,
+                st.session_state.first_name,
+                key_prefix="share"
+            )
         
-        # LinkedIn share functionality
-        linkedin_text = f"""I just became an action figure in the fight against cancer with Expect Miracles Foundation! 💪🦸
+    except Exception as e:
+        st.error(f"⚠️ Unable to prepare download: {str(e)[:100]}")
+        st.markdown("**📱 Manual Save Method:**")
+        st.info("Tap and hold on the image above, then select 'Add to Photos' or 'Save Image'")
+    
+    st.markdown("---")
+    
+    # LinkedIn Direct Share Button
+    st.markdown("### 📱 Share on Social Media")
+    
+    # LinkedIn share functionality
+    linkedin_text = f"""I just became an action figure in the fight against cancer with Expect Miracles Foundation! 💪🦸
 
 Join me in taking action against cancer research.
 
 #ExpectMiracles #CancerResearch #TakeAction #CancerAwareness"""
-        
-        # URL encode the text
-        encoded_text = urllib.parse.quote(linkedin_text)
-        linkedin_url = f"https://www.linkedin.com/feed/?shareActive=true&text={encoded_text}"
-        
-        # Create LinkedIn button with custom styling
-        st.markdown(
-            f"""
-            <div style="margin: 20px 0;">
-                <a href="{linkedin_url}" target="_blank" style="text-decoration: none;">
-                    <button style="
-                        background: #0077B5;
-                        color: white;
-                        padding: 15px 30px;
-                        border: none;
-                        border-radius: 25px;
-                        font-size: 18px;
-                        font-weight: bold;
-                        width: 100%;
-                        cursor: pointer;
-                        box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-                        display: flex;
-                        align-items: center;
-                        justify-content: center;
-                        gap: 10px;
-                    ">
-                        <span style="font-size: 24px;">in</span>
-                        Share to LinkedIn
-                    </button>
-                </a>
-            </div>
-            """,
-            unsafe_allow_html=True
-        )
+    
+    # URL encode the text
+    encoded_text = urllib.parse.quote(linkedin_text)
+    linkedin_url = f"https://www.linkedin.com/feed/?shareActive=true&text={encoded_text}"
+    
+    # Create LinkedIn button with custom styling
+    st.markdown(
+        f"""
+        <div style="margin: 20px 0;">
+            <a href="{linkedin_url}" target="_blank" style="text-decoration: none;">
+                <button style="
+                    background: #0077B5;
+                    color: white;
+                    padding: 15px 30px;
+                    border: none;
+                    border-radius: 25px;
+                    font-size: 18px;
+                    font-weight: bold;
+                    width: 100%;
+                    cursor: pointer;
+                    box-shadow: 0 4px 6px rgba(0,0,0,0.1);
+                    display: flex;
+                    align-items: center;
+                    justify-content: center;
+                    gap: 10px;
+                ">
+                    <span style="font-size: 24px;">in</span>
+                    Share to LinkedIn
+                </button>
+            </a>
+        </div>
+        """,
+        unsafe_allow_html=True
+    )
+
+    st.markdown("---")
+    
+    # Create another
+    if st.button("🔄 Create Another Action Figure", key="create_another"):
+        # Reset session state including downloaded image
+        st.session_state.step = 1
+        st.session_state.uploaded_image = None
+        st.session_state.generated_image_url = None
+        st.session_state.first_name = ""
+        st.session_state.last_name = ""
+        st.session_state.accessory = ""
+        st.session_state.upload_job = None
+        st.session_state.upload_file_id = None
+        st.session_state.postprocess_job = None
+        st.session_state.untitled_image = None
+        st.session_state.saved_image_path = None
+        drop_variants()
+        if 'downloaded_image' in st.session_state:
+            del st.session_state.downloaded_image
+        st.rerun()
+    
+    st.success("✨ Thank you for joining the fight against cancer!")
+
+# ============================================================================
+# KIOSK MODE
+# ============================================================================
+@st.cache_resource(show_spinner=False)
+def get_pickup_store():
+    """Process-wide store of kiosk jobs, shared with the pickup display"""
+    return pickup.PickupStore()
 
+@st.cache_data(show_spinner=False, max_entries=500)
+def qr_png_bytes(url):
+    """Branded QR code as PNG bytes (cached per URL)"""
+    buffered = BytesIO()
+    make_qr_image(url, box_size=8).save(buffered, format="PNG")
+    return buffered.getvalue()
+
+def pickup_url(code):
+    """Link that opens the pickup page for a code"""
+    base_url = get_secret('app', 'url', 'APP_URL') or st.context.url or ""
+    base_url = base_url.split('?', 1)[0].rstrip('/')
+    return f"{base_url}/?pickup={code}"
+
+def kiosk_capture():
+    """Kiosk Mode: capture, queue the job and reset for the next attendee"""
+    
+    if st.session_state.lane != "kiosk":
+        st.error("⚠️ Kiosk mode requires a valid kiosk token (?mode=kiosk&token=...)")
+        return
+    
+    if st.session_state.openai_client is None:
+        return
+    
+    # Confirmation for the previous attendee stays up while the next one starts
+    last_pickup = st.session_state.kiosk_last_pickup
+    if last_pickup:
+        col1, col2 = st.columns([2, 1])
+        with col1:
+            st.success(f"✅ **{last_pickup['first_name']}**, your pickup code is **{last_pickup['code']}**")
+            st.markdown("Scan the QR code or find your action figure on the pickup screen in a few minutes!")
+        with col2:
+            st.image(qr_png_bytes(pickup_url(last_pickup['code'])), width=160)
         st.markdown("---")
+    
+    # Taking the photo and typing only rerun the capture form
+    kiosk_form()
+
+@measured_fragment()
+def kiosk_form():
+    """Kiosk camera, details and submit button"""
+    
+    st.markdown("### 📸 Strike a Pose!")
+    st.markdown("Look at the camera, smile, and tap the button to take your photo")
+    
+    # Widget keys change with every submission so the form starts empty
+    form_id = st.session_state.kiosk_form_id
+    
+    photo = st.camera_input("Take your photo", key=f"kiosk_camera_{form_id}")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        first_name = st.text_input("First Name *", placeholder="e.g., Sarah", key=f"kiosk_first_{form_id}")
+    with col2:
+        last_name = st.text_input("Last Name (Optional)", placeholder="e.g., Johnson", key=f"kiosk_last_{form_id}")
+    
+    accessory = st.text_input(
+        "Accessories (Optional)",
+        placeholder="e.g., golf club, stethoscope, microphone",
+        key=f"kiosk_accessory_{form_id}"
+    )
+    
+    if st.button("🚀 Create My Action Figure!", key=f"kiosk_submit_{form_id}", type="primary", disabled=photo is None):
+        if not first_name.strip():
+            st.error("⚠️ Please enter your first name to continue")
+            return
         
-        # Create another
-        if st.button("🔄 Create Another Action Figure", key="create_another"):
-            # Reset session state including downloaded image
-            st.session_state.step = 1
-            st.session_state.uploaded_image = None
-            st.session_state.generated_image_url = None
-            st.session_state.first_name = ""
-            st.session_state.last_name = ""
-            st.session_state.accessory = ""
-            if 'downloaded_image' in st.session_state:
-                del st.session_state.downloaded_image
-            st.rerun()
+        store = get_pickup_store()
+        full_name = generation.build_full_name(first_name, last_name)
+        local_title = local_titles_enabled()
+        prompt = generation.build_prompt(full_name, accessory, blank_title=local_title)
+        code = store.create(first_name, last_name, accessory)
+        
+        # Photo preparation and generation both run in the background
+        prepared_future = upload_prep.submit_prepare(photo.getvalue())
+        try:
+            get_scheduler().submit(
+                "kiosk",
+                pickup.run_pickup_job,
+                store,
+                code,
+                get_generation_call(),
+                prepared_future,
+                prompt,
+                caption=get_event_caption(),
+                save_dir=export_results.DEFAULT_SOURCE if saving_enabled() else None,
+                title_name=full_name if local_title else None,
+                returns_future=use_async_engine()
+            )
+            metrics.increment("figures.local_titles" if local_title else "figures.model_titles")
+        except scheduler.AdmissionRejected as e:
+            if fallback_mode() != 'auto':
+                store.remove(code)
+                st.warning(f"⏳ The queue is full right now - please try again in about {e.reservation['minutes']} minutes.")
+                return
+            
+            # Queue full - make the instant figure right here (well under a second)
+            pickup.run_pickup_job(
+                store,
+                code,
+                instant_figure_call(full_name, accessory),
+                prepared_future,
+                prompt,
+                caption=get_event_caption(),
+                save_dir=export_results.DEFAULT_SOURCE if saving_enabled() else None
+            )
         
-        st.success("✨ Thank you for joining the fight against cancer!")
+        metrics.increment("kiosk_submitted")
+        st.session_state.kiosk_last_pickup = {"code": code, "first_name": first_name}
+        st.session_state.kiosk_form_id += 1
+        st.rerun()
+
+@measured_fragment(run_every=5)
+def render_pickup_grid():
+    """Recently finished figures with their pickup codes (refreshes itself)"""
+    store = get_pickup_store()
     
-    st.markdown('</div>', unsafe_allow_html=True)
+    in_progress = store.recent(status="running", limit=20) + store.recent(status="queued", limit=20)
+    if in_progress:
+        names = ", ".join(f"{r['first_name']} ({r['code']})" for r in in_progress)
+        st.info(f"⚡ **In the works:** {names}")
+    
+    finished = store.recent(status="done", limit=9)
+    if not finished:
+        st.markdown("Finished action figures will appear here.")
+        return
+    
+    columns = st.columns(3)
+    for index, record in enumerate(finished):
+        with columns[index % 3]:
+            display_name = generation.build_full_name(record['first_name'], record['last_name'])
+            st.image(record['thumbnail'], caption=f"{display_name} - Code {record['code']}", use_container_width=True)
+            st.image(qr_png_bytes(pickup_url(record['code'])), width=120)
+
+def render_pickup_display():
+    """Pickup screen shown on a separate display next to the kiosks"""
+    st.markdown("### 🎁 Pick Up Your Action Figure")
+    st.markdown("Scan the QR code under your figure to save it to your phone")
+    render_pickup_grid()
+
+@measured_fragment(run_every=3)
+def render_pickup_waiting(code):
+    """Poll a kiosk job until it finishes, then rerun the full page"""
+    record = get_pickup_store().get(code)
+    if record is None or record['status'] not in ("queued", "running"):
+        st.rerun()
+    st.info(f"⚡ Your action figure is being created, {record['first_name']}... This page updates automatically.")
+
+def render_pickup_page(code):
+    """Phone page opened from a pickup QR code (?pickup=<code>)"""
+    record = get_pickup_store().get(code)
+    if record is None:
+        st.error("⚠️ We couldn't find that pickup code. Please check it or ask a staff member.")
+        return
+    
+    if record['status'] in ("queued", "running"):
+        render_pickup_waiting(record['code'])
+        return
+    
+    if record['status'] == "failed":
+        st.error("⚠️ Something went wrong creating this action figure. Please visit the kiosk again or ask a staff member.")
+        return
+    
+    display_name = generation.build_full_name(record['first_name'], record['last_name'])
+    st.markdown(f"### 🎉 Congratulations, {display_name}!")
+    st.image(record['image_bytes'], caption=f"{display_name} - Cancer Fighting Action Figure", use_container_width=True)
+    
+    st.download_button(
+        label="💾 Download Image",
+        data=record['image_bytes'],
+        file_name=f"{record['first_name']}_action_figure.png",
+        mime="image/png",
+        key="download_pickup",
+        on_click="ignore",
+        use_container_width=True
+    )
+    st.info("📱 Or tap and hold on the image above, then select 'Add to Photos' or 'Save Image'")
+    
+    if record.get('variants_job') is not None:
+        render_variant_downloads(record['variants_job'], record['first_name'], key_prefix="pickup")
+
+# ============================================================================
+# HEALTH CHECK
+# ============================================================================
+@st.cache_resource(show_spinner=False)
+def get_readiness_report(_client, _generate, _engine, caption, local_title, full):
+    """Warm-up and API key check, plus the paid synthetic generation when full - run once per server process (?health=1)"""
+    checks = readiness.run_checks(_client, _generate, caption=caption, local_title=local_title,
+                                  skip_generation=not full, engine=_engine)
+    return {"checks": checks, "ran_at": datetime.now()}
+
+def render_health_page():
+    """
+    Warm this server process and show the readiness self-test (?health=1)
+    
+    Anyone may warm up and check the API key; the paid test generation and
+    error details need the admin token (?health=1&admin=...).
+    """
+    st.markdown("### 🩺 Readiness Check")
+    operator = is_operator()
+    
+    # Without a key the API check fails on its own - don't start the async engine for nothing
+    client = st.session_state.openai_client
+    generate = get_generation_call() if client is not None else None
+    
+    with st.spinner("Warming up and running a test generation..." if operator else "Warming up..."):
+        report = get_readiness_report(
+            client,
+            generate,
+            get_warm_up_engine(),
+            get_event_caption(),
+            local_titles_enabled(),
+            operator
+        )
+    
+    checks = report['checks']
+    if readiness.is_ready(checks):
+        st.success(f"✅ **Ready** - warmed up and verified at {report['ran_at']:%H:%M:%S}")
+    else:
+        # Don't keep a failed report - reloading the page runs the checks again
+        get_readiness_report.clear()
+        st.error("❌ **Not ready** - fix the failed checks below, then reload this page")
+    
+    icons = {"ok": "✅", "failed": "❌", "skipped": "⏭️"}
+    rows = []
+    for check in checks:
+        row = {"Check": check['check'], "Status": icons[check['status']], "Time (ms)": round(check['seconds'] * 1000)}
+        if operator:
+            row["Detail"] = check['detail']
+        rows.append(row)
+    st.table(rows)
+    
+    # Operators can re-run the paid test generation on demand
+    if operator and st.button("🔁 Run Again"):
+        get_readiness_report.clear()
+        st.rerun()
+
+# ============================================================================
+# OPERATOR PANEL
+# ============================================================================
+def is_operator():
+    """True when the URL carries the admin token (?admin=...)"""
+    admin_token = get_secret('admin', 'token', 'ADMIN_TOKEN')
+    supplied = st.query_params.get('admin')
+    return bool(admin_token and supplied and secrets.compare_digest(str(admin_token), supplied))
+
+def render_operator_panel():
+    """Render queue and latency statistics for event staff"""
+    st.markdown("### 🛠️ Operator Panel")
+    
+    stats = get_scheduler().stats()
+    st.markdown(f"**In flight:** {stats['in_flight']} | **Avg generation:** {stats['avg_service_seconds']:.0f}s | **Open reservations:** {stats['reservations_outstanding']}")
+    
+    # Per-lane wait statistics
+    rows = []
+    for lane, lane_stats in stats['lanes'].items():
+        rows.append({
+            "Lane": scheduler.LANES[lane]['label'],
+            "Queued": lane_stats['queued'],
+            "Est. wait (s)": round(lane_stats['estimated_wait']),
+            "Admitted": lane_stats['admitted'],
+            "Rejected": lane_stats['rejected'],
+            "Wait p50 (s)": round(lane_stats['wait']['p50'], 1),
+            "Wait p95 (s)": round(lane_stats['wait']['p95'], 1),
+        })
+    st.table(rows)
+    
+    # Regenerations with model vs locally drawn lettering and by variants per upload
+    counters = metrics.snapshot()['counters']
+    regeneration_rates = []
+    modes = [("model_titles", "model lettering"), ("local_titles", "local lettering")]
+    modes += [(f"variants_{n}", f"{n} per upload") for n in range(1, generation.MAX_VARIANTS + 1)]
+    for mode, label in modes:
+        figures = counters.get(f"figures.{mode}", 0)
+        if figures:
+            regenerations = counters.get(f"regenerations.{mode}", 0)
+            regeneration_rates.append(f"{label} {regenerations}/{figures} ({regenerations / figures:.0%})")
+    if regeneration_rates:
+        st.markdown(f"**Regenerations:** {' | '.join(regeneration_rates)} | **Avoided by name fixes:** {counters.get('regenerations_avoided', 0)}")
+    
+    # API errors by class (every failed attempt counts, retried or not)
+    error_counts = []
+    for error_class, info in generation.ERROR_CLASSES.items():
+        errors = counters.get(f"generation_errors.{error_class}", 0)
+        if errors:
+            retried = counters.get(f"generation_retries.{error_class}", 0)
+            failed = counters.get(f"generation_failed.{error_class}", 0)
+            error_counts.append(f"{info['label']} {errors} ({retried} retried, {failed} failed)")
+    if error_counts:
+        st.markdown(f"**API errors:** {' | '.join(error_counts)} | **Recovered by retry:** {counters.get('generation_recovered', 0)}")
+    
+    with st.expander("All metrics"):
+        st.json(metrics.snapshot())
+    
+    # Profiles land in PROFILE_DIR; summarize them with `python profiling.py report`
+    st.toggle("🔬 Profile my session", key="profiled", help="Write cProfile/tracemalloc profiles of this session's reruns and generations")
 
 # ============================================================================
 # MAIN APP FLOW
 # ============================================================================
 def main():
     """Main application function"""
+    profile_rerun = profiling.profile(
+        "rerun",
+        profiling_session(),
+        step=st.session_state.get('step', 1),
+        mode=st.query_params.get('mode')
+    )
+    with measure_rerun("app"), profile_rerun:
+        render_app()
+
+def render_app():
+    """Render the page for the current mode and step"""
     
     # Apply custom styling
     apply_custom_css()
@@ -855,13 +1795,23 @@ def main():
     # Initialize session state FIRST
     init_session_state()
     
-    # Setup OpenAI client if not already done
+    # Setup OpenAI client if not already done (shared across sessions)
     if st.session_state.openai_client is None:
-        st.session_state.openai_client = setup_openai()
+        try:
+            st.session_state.openai_client = get_shared_openai_client()
+        except RuntimeError:
+            st.session_state.openai_client = None
+    
+    # Priority lane and reservation code from the URL
+    apply_query_params()
     
     # Render header
     render_header()
     
+    # Staff-only statistics
+    if is_operator():
+        render_operator_panel()
+    
     # Show status message based on API configuration (simpler version)
     if st.session_state.openai_client is None:
         st.error("⚠️ **API Not Configured**: Please check your OpenAI API key configuration.")
@@ -869,8 +1819,20 @@ def main():
     # Render step indicator
     # render_step_indicator(st.session_state.step)  # Commented out for simplified UI at event
 
+    # Kiosk, pickup display and pickup pages replace the 4-step flow
+    pickup_code = st.query_params.get('pickup')
+    mode = st.query_params.get('mode')
+    
     # Route to appropriate step
-    if st.session_state.step == 1:
+    if st.query_params.get('health'):
+        render_health_page()
+    elif pickup_code:
+        render_pickup_page(pickup_code)
+    elif mode == "display":
+        render_pickup_display()
+    elif mode == "kiosk":
+        kiosk_capture()
+    elif st.session_state.step == 1:
         step_1_upload()
     elif st.session_state.step == 2:
         step_2_details()
@@ -0,0 +1,114 @@
+"""
+Asyncio Generation Engine
+=========================
+Runs every images.edit() call on ONE background event loop using the async
+OpenAI client. Sessions (and the scheduler) hand work over through
+thread-safe concurrent.futures.Future objects, so hundreds of in-flight
+calls cost a few coroutines each instead of a blocked thread and its stack.
+
+Usage:
+    engine = AsyncGenerationEngine(lambda: AsyncOpenAI(api_key=...))
+    future = engine.submit(png_bytes, prompt)
+    image_url = future.result()
+
+Enable it in the app with GENERATION_ENGINE=async.
+"""
+
+import asyncio
+import threading
+
+import generation
+import metrics
+
+
+class AsyncGenerationEngine:
+    """
+    Background event loop that multiplexes generation calls
+
+    Parameters:
+    - client_factory: Callable returning an async client (openai.AsyncOpenAI or
+      fake_backend.FakeAsyncOpenAIClient); called on the loop thread
+    - max_in_flight: Upper bound on concurrent API calls held by the loop
+    - retries: Retries of transient failures per call (generation.generate_with_retries_async)
+    """
+
+    def __init__(self, client_factory, max_in_flight=256, retries=generation.RETRY_LIMIT):
+        self.max_in_flight = max_in_flight
+        self.retries = retries
+        self._client_factory = client_factory
+        self._client = None
+        self._semaphore = None
+        self._in_flight = 0
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._startup_error = None
+        self._thread = threading.Thread(target=self._run_loop, name="generation-engine", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._startup_error is not None:
+            # e.g. no API key - fail here instead of leaving callers waiting on a dead loop
+            self._thread.join()
+            raise self._startup_error
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            # Loop-bound objects must be created on the loop's own thread
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+            self._client = self._client_factory()
+        except Exception as e:
+            self._startup_error = e
+        finally:
+            self._ready.set()
+        if self._startup_error is not None:
+            self._loop.close()
+            return
+        self._loop.run_forever()
+
+    async def _generate(self, png_bytes, prompt, on_partial):
+        async with self._semaphore:
+            self._in_flight += 1
+            try:
+                return await generation.generate_with_retries_async(
+                    self._client, png_bytes, prompt, on_partial, retries=self.retries
+                )
+            finally:
+                self._in_flight -= 1
+
+    async def _warm_up(self):
+        await self._client.models.retrieve(generation.MODEL)
+
+    def warm_up(self):
+        """
+        Open the engine's own pooled connection with one cheap authenticated request
+
+        Returns:
+        - concurrent.futures.Future that resolves when the request finishes
+          (its exception is the API error, e.g. an invalid key)
+        """
+        return asyncio.run_coroutine_threadsafe(self._warm_up(), self._loop)
+
+    def submit(self, png_bytes, prompt, on_partial=None):
+        """
+        Start a generation from any thread
+
+        Parameters:
+        - png_bytes: PNG-encoded reference photo
+        - prompt: prompt from generation.build_prompt()
+        - on_partial: Optional callback for streamed preview frames (runs on the loop thread)
+
+        Returns:
+        - concurrent.futures.Future resolving to the image URL
+        """
+        metrics.increment("engine_submitted")
+        return asyncio.run_coroutine_threadsafe(self._generate(png_bytes, prompt, on_partial), self._loop)
+
+    @property
+    def in_flight(self):
+        """Number of API calls currently awaiting a response"""
+        return self._in_flight
+
+    def shutdown(self, timeout=5):
+        """Stop the loop (pending calls are abandoned)"""
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
@@ -0,0 +1,157 @@
+"""
+Generation Engine Benchmark
+===========================
+Compares the blocking model (one thread pinned per in-flight images.edit()
+call) with the asyncio engine (one event loop thread) while holding many
+concurrent calls against the fake backend.
+
+Each model runs in its own subprocess so thread counts and RSS don't mix.
+
+Usage:
+    python benchmarks/bench_engine.py
+    python benchmarks/bench_engine.py --requests 500 --latency 3
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import async_engine  # noqa: E402
+import generation  # noqa: E402
+from fake_backend import FakeAsyncOpenAIClient, FakeOpenAIClient  # noqa: E402
+
+PNG_PAYLOAD = b"\x89PNG benchmark payload"
+
+
+def read_process_status():
+    """Current thread count and resident memory (MB) from /proc, with fallbacks"""
+    threads = threading.active_count()
+    rss_mb = None
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("Threads:"):
+                    threads = int(line.split()[1])
+                elif line.startswith("VmRSS:"):
+                    rss_mb = int(line.split()[1]) / 1024
+    except OSError:
+        import resource
+        # ru_maxrss is KB on Linux and bytes on macOS - good enough as a peak
+        rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return threads, rss_mb
+
+
+class PeakSampler:
+    """Samples thread count and RSS in the background and keeps the peaks"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak_threads = 0
+        self.peak_rss_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            threads, rss_mb = read_process_status()
+            self.peak_threads = max(self.peak_threads, threads)
+            self.peak_rss_mb = max(self.peak_rss_mb, rss_mb or 0.0)
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_blocking(requests, latency):
+    """Current model: every in-flight call holds its own thread"""
+    client = FakeOpenAIClient(latency=latency, render=False)
+    with ThreadPoolExecutor(max_workers=requests) as pool:
+        futures = [pool.submit(generation.call_images_edit, client, PNG_PAYLOAD, "benchmark") for _ in range(requests)]
+        return [f.result() for f in futures]
+
+
+def run_async(requests, latency):
+    """Asyncio engine: one loop thread holds every in-flight call"""
+    engine = async_engine.AsyncGenerationEngine(
+        lambda: FakeAsyncOpenAIClient(latency=latency, render=False),
+        max_in_flight=requests
+    )
+    futures = [engine.submit(PNG_PAYLOAD, "benchmark") for _ in range(requests)]
+    results = [f.result() for f in futures]
+    engine.shutdown()
+    return results
+
+
+def measure(mode, requests, latency):
+    """Run one model in this process and return its measurements"""
+    runner = run_blocking if mode == "blocking" else run_async
+    baseline_threads, baseline_rss = read_process_status()
+
+    start = time.perf_counter()
+    with PeakSampler() as sampler:
+        results = runner(requests, latency)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "mode": mode,
+        "requests": requests,
+        "completed": sum(1 for r in results if r),
+        "seconds": elapsed,
+        "baseline_threads": baseline_threads,
+        "peak_threads": sampler.peak_threads,
+        "baseline_rss_mb": baseline_rss,
+        "peak_rss_mb": sampler.peak_rss_mb,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare blocking vs asyncio generation engines")
+    parser.add_argument("--requests", type=int, default=300, help="Concurrent in-flight calls")
+    parser.add_argument("--latency", type=float, default=2.0, help="Seconds per fake API call")
+    parser.add_argument("--mode", choices=["blocking", "async"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Child process: run one model and print JSON for the parent
+    if args.mode:
+        print(json.dumps(measure(args.mode, args.requests, args.latency)))
+        return
+
+    print("\n" + "="*60)
+    print(f"⚙️  Engine Benchmark: {args.requests} concurrent calls, {args.latency}s each")
+    print("="*60 + "\n")
+
+    results = []
+    for mode in ("blocking", "async"):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--mode", mode,
+             "--requests", str(args.requests), "--latency", str(args.latency)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{'Mode':<10}{'Done':>6}{'Wall (s)':>10}{'Threads':>10}{'RSS (MB)':>10}{'ΔRSS (MB)':>11}")
+    for r in results:
+        print(f"{r['mode']:<10}{r['completed']:>6}{r['seconds']:>10.2f}{r['peak_threads']:>10}"
+              f"{r['peak_rss_mb']:>10.1f}{r['peak_rss_mb'] - r['baseline_rss_mb']:>11.1f}")
+
+    blocking, engine = results
+    print(f"\n🧵 Threads: {blocking['peak_threads']} → {engine['peak_threads']}")
+    print(f"💾 Extra RSS: {blocking['peak_rss_mb'] - blocking['baseline_rss_mb']:.1f} MB → "
+          f"{engine['peak_rss_mb'] - engine['baseline_rss_mb']:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+"""
+Image Pipeline Benchmark
+========================
+Times every image stage an attendee's photo goes through, over a synthetic
+phone-photo corpus, and fails when a stage got slower (or hungrier) than a
+stored baseline.
+
+Corpus (deterministic, generated once into benchmarks/corpus/):
+    JPEG, PNG and HEIC at 12, 24 and 48 MP, plus RGBA PNG, CMYK JPEG and an
+    EXIF-rotated JPEG at the smallest size; HEIC cases are skipped without
+    pillow-heif or when the local libheif cannot decode them
+
+Stages:
+    step1_open      Step 1 on the Streamlit thread: open + convert non-RGB modes
+    decode          upload_prep.decode_upload() (JPEG draft decode, HEIC decode)
+    convert         EXIF transpose and mode conversion (RGBA/CMYK -> RGB)
+    png_encode      PNG encoding of the downscaled API payload
+    upload_prep     upload_prep.prepare_upload() end to end
+    b64_decode      Step 4: generation.fetch_image_bytes() on a base64 result
+    share_variants  Step 4: postprocess.process_result() (stamped share formats)
+
+Usage:
+    python benchmarks/bench_image_pipeline.py --save-baseline
+    python benchmarks/bench_image_pipeline.py                 # exits 1 on regressions
+    python benchmarks/bench_image_pipeline.py --sizes 12 --repeat 5 --threshold 0.25
+"""
+
+import argparse
+import base64
+import ctypes
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from io import BytesIO
+from statistics import NormalDist
+
+import PIL
+from PIL import Image, ImageChops, ImageOps
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import generation  # noqa: E402
+import postprocess  # noqa: E402
+import upload_prep  # noqa: E402
+from fake_backend import render_fake_figure  # noqa: E402
+
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIC_SUPPORTED = True
+except ImportError:
+    HEIC_SUPPORTED = False
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_DIR = os.path.join(BENCH_DIR, "corpus")
+BASELINE_PATH = os.path.join(BENCH_DIR, "image_pipeline_baseline.json")
+
+# Megapixels -> (width, height), 4:3 like phone cameras
+SIZES = {12: (4000, 3000), 24: (5664, 4248), 48: (8000, 6000)}
+
+# Differences below these are noise, whatever the percentage
+MIN_SECONDS_DELTA = 0.025
+MIN_MEMORY_DELTA_MB = 16
+
+EXIF_ORIENTATION = 0x0112
+
+# Encoder quality per format - HEIC at phone-like bitrates (libde265 fails on
+# very high-bitrate 24 MP+ files)
+QUALITY = {"JPEG": 90, "HEIF": 50}
+
+# Uniform random byte -> coarse color level, and -> Gaussian sensor noise
+# (sigma 4) offset by 128 for ImageChops.add()
+COARSE_LEVELS = [30 + value * 195 // 255 for value in range(256)]
+NOISE_LEVELS = [128 + round(4 * NormalDist().inv_cdf((value + 0.5) / 256)) for value in range(256)]
+
+
+# ============================================================================
+# SYNTHETIC CORPUS
+# ============================================================================
+def synthetic_photo(size, seed):
+    """
+    Deterministic photo-like RGB image: smooth color regions plus sensor noise
+
+    Smooth areas and fine noise make JPEG/PNG/HEIC file sizes and decode
+    costs behave like real phone photos rather than flat test cards.
+    """
+    rng = random.Random(seed)
+    width, height = size
+    coarse_size = (max(2, width // 250), max(2, height // 250))
+    coarse = Image.frombytes("RGB", coarse_size, rng.randbytes(coarse_size[0] * coarse_size[1] * 3))
+    image = coarse.point(COARSE_LEVELS * 3).resize(size, Image.BICUBIC)
+
+    # Add noise in bands of rows to keep memory near one image
+    for top in range(0, height, 512):
+        box = (0, top, width, min(height, top + 512))
+        band_size = (width, box[3] - top)
+        noise = Image.frombytes("RGB", band_size, rng.randbytes(band_size[0] * band_size[1] * 3))
+        image.paste(ImageChops.add(image.crop(box), noise.point(NOISE_LEVELS * 3), offset=-128), box)
+    return image
+
+
+def corpus_cases(sizes):
+    """Case name -> (megapixels, format, file extension, variant)"""
+    cases = {}
+    for megapixels in sizes:
+        cases[f"jpeg_{megapixels}mp"] = (megapixels, "JPEG", "jpg", None)
+        cases[f"png_{megapixels}mp"] = (megapixels, "PNG", "png", None)
+        if HEIC_SUPPORTED:
+            cases[f"heic_{megapixels}mp"] = (megapixels, "HEIF", "heic", None)
+    smallest = min(sizes)
+    cases[f"rgba_png_{smallest}mp"] = (smallest, "PNG", "png", "rgba")
+    cases[f"cmyk_jpeg_{smallest}mp"] = (smallest, "JPEG", "jpg", "cmyk")
+    cases[f"rotated_jpeg_{smallest}mp"] = (smallest, "JPEG", "jpg", "rotated")
+    return cases
+
+
+def build_case(path, megapixels, fmt, variant):
+    """Write one corpus file (same seed, same pixels every time)"""
+    image = synthetic_photo(SIZES[megapixels], seed=megapixels)
+    save_kwargs = {"format": fmt}
+    if fmt in QUALITY:
+        save_kwargs["quality"] = QUALITY[fmt]
+
+    if variant == "rgba":
+        alpha = Image.linear_gradient("L").resize(image.size)
+        image.putalpha(alpha)
+    elif variant == "cmyk":
+        image = image.convert("CMYK")
+    elif variant == "rotated":
+        # Stored sideways like a portrait phone photo; EXIF says rotate 90°
+        image = image.transpose(Image.ROTATE_90)
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION] = 6
+        save_kwargs["exif"] = exif
+
+    image.save(path, **save_kwargs)
+
+
+def load_corpus(sizes):
+    """Case name -> file bytes, generating missing files first"""
+    os.makedirs(CORPUS_DIR, exist_ok=True)
+    corpus = {}
+    for case, (megapixels, fmt, extension, variant) in corpus_cases(sizes).items():
+        path = os.path.join(CORPUS_DIR, f"{case}.{extension}")
+        if not os.path.exists(path):
+            print(f"🧪 Generating {case}...")
+            build_case(path, megapixels, fmt, variant)
+        with open(path, "rb") as f:
+            raw_bytes = f.read()
+        if fmt == "HEIF" and not decodable(raw_bytes):
+            print(f"⚠️  Skipping {case}: this libheif build cannot decode it")
+            continue
+        corpus[case] = raw_bytes
+    return corpus
+
+
+def decodable(raw_bytes):
+    try:
+        Image.open(BytesIO(raw_bytes)).load()
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+# ============================================================================
+# MEMORY
+# ============================================================================
+def read_rss_mb(field):
+    """VmRSS / VmHWM from /proc in MB (None where /proc is unavailable)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Reset the kernel's peak RSS counter (Linux); False if unsupported"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def release_memory():
+    """Hand freed memory back to the OS so the next peak is the stage's own"""
+    gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass  # not glibc - peaks include memory the allocator kept
+
+
+# ============================================================================
+# STAGES
+# ============================================================================
+def step1_open(raw_bytes):
+    # Same as step_1_upload: non-RGB/RGBA modes (HEIC, CMYK) are converted in full
+    image = Image.open(BytesIO(raw_bytes))
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGB')
+    image.load()
+    return image
+
+
+def convert(image):
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+
+def downscale(image):
+    image = image.copy()
+    image.thumbnail((upload_prep.MAX_UPLOAD_SIDE, upload_prep.MAX_UPLOAD_SIDE), Image.LANCZOS)
+    return image
+
+
+def png_encode(image):
+    buffered = BytesIO()
+    image.save(buffered, format='PNG')
+    return buffered.getvalue()
+
+
+def upload_stages(raw_bytes):
+    """Stage name -> zero-argument callable for one uploaded photo"""
+    decoded = upload_prep.decode_upload(raw_bytes)
+    payload = downscale(convert(decoded))
+    return {
+        "step1_open": lambda: step1_open(raw_bytes),
+        "decode": lambda: upload_prep.decode_upload(raw_bytes),
+        "convert": lambda: convert(decoded),
+        "png_encode": lambda: png_encode(payload),
+        "upload_prep": lambda: upload_prep.prepare_upload(raw_bytes),
+    }
+
+
+def result_stages():
+    """Step 4 stages on a 1024x1536 generated figure delivered as base64"""
+    reference = png_encode(synthetic_photo((768, 1024), seed=1))
+    image_bytes = render_fake_figure(reference)
+    data_url = f"data:image/png;base64,{base64.b64encode(image_bytes).decode()}"
+    return {
+        "b64_decode": lambda: generation.fetch_image_bytes(data_url),
+        "share_variants": lambda: postprocess.process_result(image_bytes, "Expect Miracles Gala • June 5, 2025"),
+    }
+
+
+def measure(stage, repeat):
+    """Median seconds over repeat runs and the peak RSS growth of one run"""
+    stage()  # warm-up: imports, cached fonts and layers
+    release_memory()
+    rss_before = read_rss_mb("VmRSS")
+    peak_supported = reset_peak_rss()
+    stage()
+    peak = read_rss_mb("VmHWM")
+    peak_mb = peak - rss_before if peak_supported and peak is not None and rss_before is not None else None
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stage()
+        samples.append(time.perf_counter() - start)
+    return {"seconds": statistics.median(samples), "peak_mb": peak_mb}
+
+
+def run(sizes, repeat):
+    results = {}
+    for case, raw_bytes in load_corpus(sizes).items():
+        print(f"⏱️  {case} ({len(raw_bytes) / 1e6:.1f} MB)")
+        results[case] = {stage: measure(fn, repeat) for stage, fn in upload_stages(raw_bytes).items()}
+    print("⏱️  result (1024x1536 figure)")
+    results["result"] = {stage: measure(fn, repeat) for stage, fn in result_stages().items()}
+    return results
+
+
+# ============================================================================
+# BASELINE COMPARISON
+# ============================================================================
+def compare(results, baseline, threshold):
+    """List of (case, stage, metric, baseline value, current value) that regressed"""
+    regressions = []
+    for case, stages in results.items():
+        for stage, current in stages.items():
+            previous = baseline.get(case, {}).get(stage)
+            if previous is None:
+                continue
+            if (current["seconds"] > previous["seconds"] * (1 + threshold)
+                    and current["seconds"] - previous["seconds"] > MIN_SECONDS_DELTA):
+                regressions.append((case, stage, "seconds", previous["seconds"], current["seconds"]))
+            if (current["peak_mb"] is not None and previous.get("peak_mb") is not None
+                    and current["peak_mb"] > previous["peak_mb"] * (1 + threshold)
+                    and current["peak_mb"] - previous["peak_mb"] > MIN_MEMORY_DELTA_MB):
+                regressions.append((case, stage, "peak_mb", previous["peak_mb"], current["peak_mb"]))
+    return regressions
+
+
+def print_results(results, baseline):
+    print(f"\n{'Case':<20}{'Stage':<16}{'ms':>9}{'Baseline':>10}{'Change':>9}{'Peak MB':>9}")
+    for case, stages in results.items():
+        for stage, current in stages.items():
+            previous = baseline.get(case, {}).get(stage)
+            base_ms = f"{previous['seconds'] * 1000:>10.1f}" if previous else f"{'-':>10}"
+            change = f"{current['seconds'] / previous['seconds'] - 1:>+9.0%}" if previous else f"{'-':>9}"
+            peak = f"{current['peak_mb']:>9.1f}" if current["peak_mb"] is not None else f"{'-':>9}"
+            print(f"{case:<20}{stage:<16}{current['seconds'] * 1000:>9.1f}{base_ms}{change}{peak}")
+
+
+def main():
+    # Pillow's block cache would hide allocations from the peak RSS figures
+    Image.core.set_blocks_max(0)
+
+    parser = argparse.ArgumentParser(description="Benchmark the photo upload and result image pipeline")
+    parser.add_argument("--sizes", type=int, nargs="+", choices=sorted(SIZES), default=sorted(SIZES),
+                        help="Megapixel sizes to include")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per stage (median is kept)")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown before failing (0.25 = 25%%)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    args = parser.parse_args()
+
+    print("\n" + "="*60)
+    print(f"🖼️  Image Pipeline Benchmark (Pillow {PIL.__version__}, HEIC {'on' if HEIC_SUPPORTED else 'off'})")
+    print("="*60 + "\n")
+
+    results = run(args.sizes, args.repeat)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    print_results(results, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "pillow": PIL.__version__,
+                "machine": platform.machine(),
+                "results": results,
+            }, f, indent=2)
+        print(f"\n💾 Baseline saved: {args.baseline}")
+        return
+
+    if not baseline:
+        print(f"\nℹ️  No baseline at {args.baseline} - run with --save-baseline to create one")
+        return
+
+    regressions = compare(results, baseline, args.threshold)
+    if not regressions:
+        print(f"\n✅ No stage regressed by more than {args.threshold:.0%}")
+        return
+
+    print(f"\n❌ {len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+    for case, stage, metric, previous, current in regressions:
+        print(f"   {case} / {stage}: {metric} {previous:.3f} → {current:.3f}")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Brand Assets for Expect Miracles App
+====================================
+Colors, fonts, the logo and the packaging title used when the app draws
+on images itself (event overlays, share variants, local titles). Fonts and
+logos are loaded once per size and cached, so per-figure work is only
+compositing.
+
+Drop files into the assets/ folder to override the defaults:
+    assets/bold.ttf, assets/regular.ttf, assets/script.ttf  - fonts
+    assets/logo.png                                         - logo (RGBA)
+"""
+
+import os
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFont
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+
+# Brand colors (RGB) - match the CSS and the prompt
+NAVY = (26, 35, 126)
+PURPLE = (123, 44, 133)
+BLUE = (59, 130, 246)
+GOLD = (255, 215, 0)
+WHITE = (255, 255, 255)
+DEEP_PURPLE = (74, 20, 99)
+
+# Titles that would need a smaller font than this go on two lines
+TITLE_MIN_ONE_LINE = 48
+
+# System fonts tried in order when assets/ has no override
+FONT_CANDIDATES = {
+    "bold": ["DejaVuSans-Bold.ttf", "Arial Bold.ttf", "arialbd.ttf", "LiberationSans-Bold.ttf"],
+    "regular": ["DejaVuSans.ttf", "Arial.ttf", "arial.ttf", "LiberationSans-Regular.ttf"],
+    "script": ["DejaVuSerif-BoldItalic.ttf", "Georgia Bold Italic.ttf", "georgiaz.ttf", "DejaVuSans-BoldOblique.ttf"],
+}
+
+
+@lru_cache(maxsize=128)
+def load_font(size, style="bold"):
+    """
+    Load a TrueType font at a pixel size (cached)
+
+    Parameters:
+    - size: Font size in pixels
+    - style: 'bold', 'regular' or 'script'
+
+    Returns:
+    - PIL ImageFont
+    """
+    candidates = [os.path.join(ASSETS_DIR, f"{style}.ttf")] + FONT_CANDIDATES.get(style, [])
+    for name in candidates:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    # Pillow's built-in font scales from Pillow 10.1 onwards
+    return ImageFont.load_default(size=size)
+
+
+@lru_cache(maxsize=512)
+def fit_font(text, max_width, style="bold", max_size=96, min_size=24):
+    """
+    Largest cached font (max_size down to min_size) that fits text within max_width
+
+    Returns:
+    - PIL ImageFont
+    """
+    for size in range(max_size, min_size, -2):
+        font = load_font(size, style)
+        if font.getlength(text) <= max_width:
+            return font
+    return load_font(min_size, style)
+
+
+def draw_title(draw, title, wrapped, box):
+    """
+    Draw a packaging title in a box, shadowed and outlined like the printed boxes
+
+    Parameters:
+    - draw: ImageDraw of the image to letter
+    - title: One-line title, e.g. 'SARAH JOHNSON: ACTION FIGURE'
+    - wrapped: The same title as two lines, used when one line would be too small
+    - box: (left, top, right, bottom) the title is fitted into
+    """
+    max_width = box[2] - box[0]
+    font = fit_font(title, max_width, "bold", 88, 28)
+    if font.getlength(title) <= max_width and font.size >= TITLE_MIN_ONE_LINE:
+        lines = [title]
+    else:
+        lines = wrapped
+        font = min((fit_font(line, max_width, "bold", 64, 24) for line in lines), key=lambda f: f.size)
+
+    line_height = (box[3] - box[1]) / len(lines)
+    center_x = (box[0] + box[2]) / 2
+    for index, line in enumerate(lines):
+        center_y = box[1] + line_height * (index + 0.5)
+        draw.text((center_x + 4, center_y + 5), line, font=font, fill=DEEP_PURPLE, anchor="mm")
+        draw.text((center_x, center_y), line, font=font, fill=WHITE, anchor="mm",
+                  stroke_width=4, stroke_fill=BLUE)
+
+
+def _draw_badge(size):
+    """Fallback logo: gold-ringed navy badge with 'EM' when no logo.png is present"""
+    scale = 4  # draw large then downsample for smooth edges
+    big = size * scale
+    badge = Image.new("RGBA", (big, big), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(badge)
+    draw.ellipse((0, 0, big - 1, big - 1), fill=GOLD)
+    ring = big // 12
+    draw.ellipse((ring, ring, big - 1 - ring, big - 1 - ring), fill=NAVY)
+    font = load_font(big // 3, "bold")
+    draw.text((big / 2, big / 2), "EM", font=font, fill=WHITE, anchor="mm")
+    return badge.resize((size, size), Image.LANCZOS)
+
+
+@lru_cache(maxsize=16)
+def load_logo(height):
+    """
+    Logo scaled to a height in pixels (cached)
+
+    Returns:
+    - RGBA PIL Image
+    """
+    path = os.path.join(ASSETS_DIR, "logo.png")
+    if os.path.exists(path):
+        logo = Image.open(path).convert("RGBA")
+        width = max(1, round(logo.width * height / logo.height))
+        return logo.resize((width, height), Image.LANCZOS)
+    return _draw_badge(height)
+
+
+def preload(font_sizes=(28, 36, 48, 64, 96), logo_heights=(48, 64)):
+    """Load common font sizes and logos ahead of time (startup warm-up)"""
+    for size in font_sizes:
+        for style in FONT_CANDIDATES:
+            load_font(size, style)
+    for height in logo_heights:
+        load_logo(height)
@@ -0,0 +1,334 @@
+"""
+Post-Event Bulk Export for Expect Miracles App
+==============================================
+Packages every saved action figure for staff after the event:
+
+- A ZIP of all figures (streamed file by file, so memory stays flat)
+- Printable contact sheets (pages built in parallel worker processes)
+- A CSV of name and accessory for each figure
+
+The app writes figures and a manifest.csv into generated_images/ when
+saving is enabled (SAVE_GENERATED_IMAGES=1 or [storage] save_images = true).
+
+Usage:
+    python export_results.py
+    python export_results.py --source generated_images --output exports --workers 4
+"""
+
+import argparse
+import csv
+import os
+import re
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from PIL import Image, ImageDraw
+
+import brand_assets
+
+DEFAULT_SOURCE = "generated_images"
+DEFAULT_OUTPUT = "exports"
+MANIFEST_NAME = "manifest.csv"
+MANIFEST_FIELDS = ["filename", "first_name", "last_name", "accessory", "created_at"]
+
+# Contact sheet page: US Letter at 300 DPI
+PAGE_SIZE = (2550, 3300)
+PAGE_DPI = 300
+PAGE_MARGIN = 90
+CAPTION_HEIGHT = 60
+
+_manifest_lock = threading.Lock()
+
+
+# ============================================================================
+# SAVING RESULTS (called by the app)
+# ============================================================================
+def safe_filename_part(text):
+    """Keep names filesystem-safe: letters, digits, dash and underscore only"""
+    cleaned = re.sub(r"[^A-Za-z0-9_-]+", "_", text.strip())
+    return cleaned.strip("_") or "attendee"
+
+
+def save_result(image_bytes, first_name, last_name="", accessory="", directory=DEFAULT_SOURCE, replaces=None):
+    """
+    Write a generated figure and append it to the manifest
+
+    Parameters:
+    - image_bytes: PNG bytes of the generated image
+    - first_name, last_name, accessory: Attendee details for the CSV
+    - directory: Folder to write into (created if missing)
+    - replaces: Path returned by an earlier save_result() for the same
+      figure (e.g. before a name correction); that file and its manifest
+      row are removed so the attendee is exported once
+
+    Returns:
+    - path of the saved image
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    # Generate filename with timestamp (microseconds avoid collisions under load)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    filename = f"{safe_filename_part(first_name)}_{timestamp}.png"
+    path = os.path.join(directory, filename)
+
+    with open(path, "wb") as f:
+        f.write(image_bytes)
+
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    with _manifest_lock:
+        is_new = not os.path.exists(manifest_path)
+        with open(manifest_path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=MANIFEST_FIELDS)
+            if is_new:
+                writer.writeheader()
+            writer.writerow({
+                "filename": filename,
+                "first_name": first_name,
+                "last_name": last_name,
+                "accessory": accessory,
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+            })
+        if replaces:
+            _remove_result_locked(replaces, directory)
+    return path
+
+
+def _remove_result_locked(path, directory):
+    """Delete a saved figure and rewrite the manifest without its row"""
+    filename = os.path.basename(path)
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    with open(manifest_path, newline="", encoding="utf-8") as f:
+        rows = [row for row in csv.DictReader(f) if row["filename"] != filename]
+
+    # Write a copy and swap it in, so the manifest is never half-written
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=MANIFEST_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(temp_path, manifest_path)
+
+    try:
+        os.remove(os.path.join(directory, filename))
+    except FileNotFoundError:
+        pass
+
+
+def iter_results(directory=DEFAULT_SOURCE):
+    """
+    Yield one record per saved figure (manifest order)
+
+    Falls back to scanning *.png files when there is no manifest.
+    """
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                if os.path.exists(os.path.join(directory, row["filename"])):
+                    yield row
+        return
+
+    for filename in sorted(os.listdir(directory)):
+        if filename.lower().endswith(".png"):
+            yield {
+                "filename": filename,
+                "first_name": filename.split("_", 1)[0],
+                "last_name": "",
+                "accessory": "",
+                "created_at": "",
+            }
+
+
+# ============================================================================
+# EXPORT
+# ============================================================================
+def write_zip(records, directory, zip_path, csv_path):
+    """
+    Stream every figure into a ZIP, one file at a time
+
+    PNGs are already compressed, so they are stored rather than deflated.
+
+    Returns:
+    - (image count, bytes written)
+    """
+    count = 0
+    total_bytes = 0
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for record in records:
+            path = os.path.join(directory, record["filename"])
+            archive.write(path, arcname=f"figures/{record['filename']}")
+            total_bytes += os.path.getsize(path)
+            count += 1
+        archive.write(csv_path, arcname=os.path.basename(csv_path))
+    return count, total_bytes
+
+
+def write_csv(records, csv_path):
+    """Write the name/accessory CSV for staff"""
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["First Name", "Last Name", "Accessory", "Created", "File"])
+        for record in records:
+            writer.writerow([
+                record["first_name"],
+                record["last_name"],
+                record["accessory"],
+                record["created_at"],
+                record["filename"],
+            ])
+
+
+def render_contact_page(args):
+    """
+    Build and save one contact-sheet page (runs in a worker process)
+
+    Parameters:
+    - args: (page number, list of (path, caption), columns, rows, output folder)
+
+    Returns:
+    - path of the saved page
+    """
+    page_number, entries, columns, rows, output_dir = args
+
+    page = Image.new("RGB", PAGE_SIZE, brand_assets.WHITE)
+    draw = ImageDraw.Draw(page)
+    font = brand_assets.load_font(36, "regular")
+
+    cell_width = (PAGE_SIZE[0] - 2 * PAGE_MARGIN) // columns
+    cell_height = (PAGE_SIZE[1] - 2 * PAGE_MARGIN) // rows
+    thumb_box = (cell_width - 20, cell_height - CAPTION_HEIGHT - 20)
+
+    for index, (path, caption) in enumerate(entries):
+        x = PAGE_MARGIN + (index % columns) * cell_width
+        y = PAGE_MARGIN + (index // columns) * cell_height
+
+        # Only one full-size image is decoded at a time per worker
+        with Image.open(path) as image:
+            image.thumbnail(thumb_box, Image.LANCZOS, reducing_gap=2.0)
+            thumb = image.convert("RGB")
+        page.paste(thumb, (x + (cell_width - thumb.width) // 2, y + 10))
+        draw.text(
+            (x + cell_width / 2, y + cell_height - CAPTION_HEIGHT / 2),
+            caption,
+            font=font,
+            fill=brand_assets.NAVY,
+            anchor="mm"
+        )
+
+    page_path = os.path.join(output_dir, f"contact_sheet_{page_number:03d}.png")
+    page.save(page_path, dpi=(PAGE_DPI, PAGE_DPI))
+    return page_path
+
+
+def write_contact_sheets(records, directory, output_dir, columns=5, rows=6, workers=None):
+    """
+    Build contact-sheet pages in parallel worker processes
+
+    Returns:
+    - list of page paths
+    """
+    per_page = columns * rows
+    jobs = []
+    page_entries = []
+    for record in records:
+        caption = f"{record['first_name']} {record['last_name']}".strip()
+        page_entries.append((os.path.join(directory, record["filename"]), caption))
+        if len(page_entries) == per_page:
+            jobs.append((len(jobs) + 1, page_entries, columns, rows, output_dir))
+            page_entries = []
+    if page_entries:
+        jobs.append((len(jobs) + 1, page_entries, columns, rows, output_dir))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(render_contact_page, jobs))
+
+
+def export_all(source=DEFAULT_SOURCE, output=DEFAULT_OUTPUT, columns=5, rows=6, workers=None,
+               make_zip=True, make_sheets=True):
+    """
+    Run the full export and report throughput
+
+    Returns:
+    - dict with output paths, counts and timings
+    """
+    records = list(iter_results(source))
+    if not records:
+        raise FileNotFoundError(f"No saved figures found in '{source}'")
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_dir = os.path.join(output, f"export_{timestamp}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    report = {"images": len(records), "output_dir": output_dir}
+
+    csv_path = os.path.join(output_dir, "figures.csv")
+    write_csv(records, csv_path)
+    report["csv"] = csv_path
+
+    if make_zip:
+        start = time.perf_counter()
+        zip_path = os.path.join(output_dir, "expect_miracles_figures.zip")
+        count, total_bytes = write_zip(records, source, zip_path, csv_path)
+        elapsed = time.perf_counter() - start
+        report["zip"] = zip_path
+        report["zip_seconds"] = elapsed
+        report["zip_images_per_second"] = count / elapsed if elapsed else 0.0
+        report["zip_mb_per_second"] = total_bytes / (1024 * 1024) / elapsed if elapsed else 0.0
+
+    if make_sheets:
+        start = time.perf_counter()
+        pages = write_contact_sheets(records, source, output_dir, columns, rows, workers)
+        elapsed = time.perf_counter() - start
+        report["contact_sheets"] = pages
+        report["sheet_seconds"] = elapsed
+        report["sheet_images_per_second"] = len(records) / elapsed if elapsed else 0.0
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export all saved action figures after an event")
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="Folder of saved figures (default: generated_images)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Folder for the export (default: exports)")
+    parser.add_argument("--columns", type=int, default=5, help="Contact sheet columns per page")
+    parser.add_argument("--rows", type=int, default=6, help="Contact sheet rows per page")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes for contact sheets (default: CPU count)")
+    parser.add_argument("--no-zip", action="store_true", help="Skip the ZIP archive")
+    parser.add_argument("--no-sheets", action="store_true", help="Skip the contact sheets")
+    args = parser.parse_args()
+
+    print("\n" + "="*60)
+    print("📦 Exporting Expect Miracles Action Figures")
+    print("="*60 + "\n")
+
+    try:
+        report = export_all(
+            source=args.source,
+            output=args.output,
+            columns=args.columns,
+            rows=args.rows,
+            workers=args.workers,
+            make_zip=not args.no_zip,
+            make_sheets=not args.no_sheets
+        )
+    except FileNotFoundError as e:
+        print(f"❌ {e}")
+        exit(1)
+
+    print(f"🖼️  Figures: {report['images']}")
+    print(f"📋 CSV: {report['csv']}")
+    if "zip" in report:
+        print(f"🗜️  ZIP: {report['zip']}")
+        print(f"   {report['zip_seconds']:.1f}s - {report['zip_images_per_second']:.0f} images/s, {report['zip_mb_per_second']:.0f} MB/s")
+    if "contact_sheets" in report:
+        print(f"🗂️  Contact sheets: {len(report['contact_sheets'])} pages in {report['output_dir']}")
+        print(f"   {report['sheet_seconds']:.1f}s - {report['sheet_images_per_second']:.0f} images/s")
+
+    print("\n✨ Export complete!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Fake Images Backend for Development and Testing
+===============================================
+A stand-in for the OpenAI client that answers images.edit() locally, with
+configurable latency, optional streaming of partial images and optional
+failures. Lets the app, benchmarks and self-tests run without an API key
+or spending credits.
+
+Usage:
+    IMAGE_BACKEND=fake streamlit run app.py
+
+    from fake_backend import FakeOpenAIClient
+    client = FakeOpenAIClient(latency=0.5)
+"""
+
+import asyncio
+import base64
+import time
+from functools import lru_cache
+from io import BytesIO
+from types import SimpleNamespace
+
+from PIL import Image, ImageDraw, ImageFilter
+
+import brand_assets
+import generation
+
+OUTPUT_SIZE = (1024, 1536)
+
+
+def render_fake_figure(reference_png, progress=1.0, blank_header=False):
+    """
+    Draw a placeholder 'action figure': the reference photo on a purple card
+
+    Parameters:
+    - reference_png: PNG bytes of the uploaded photo
+    - progress: 0..1 - earlier partial frames are blurrier
+    - blank_header: Leave the top of the card empty, as asked for by
+      build_prompt(..., blank_title=True)
+
+    Returns:
+    - PNG bytes at OUTPUT_SIZE
+    """
+    canvas = Image.new("RGB", OUTPUT_SIZE, brand_assets.PURPLE)
+    draw = ImageDraw.Draw(canvas)
+    top = int(OUTPUT_SIZE[1] * generation.BLANK_HEADER_FRACTION) if blank_header else 260
+    draw.rounded_rectangle((112, top, 912, 1400), radius=40, outline=brand_assets.WHITE, width=6)
+
+    photo = Image.open(BytesIO(reference_png)).convert("RGB")
+    photo.thumbnail((760, 1380 - top))
+    canvas.paste(photo, ((OUTPUT_SIZE[0] - photo.width) // 2, top + 20))
+
+    if not blank_header:
+        draw.text((OUTPUT_SIZE[0] / 2, 140), "TEST FIGURE", font=brand_assets.load_font(96, "bold"),
+                  fill=brand_assets.WHITE, anchor="mm")
+
+    if progress < 1.0:
+        canvas = canvas.filter(ImageFilter.GaussianBlur(radius=int(24 * (1.0 - progress)) + 1))
+
+    buffered = BytesIO()
+    canvas.save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+@lru_cache(maxsize=1)
+def placeholder_png():
+    """Tiny constant PNG for benchmarks that should not measure drawing"""
+    buffered = BytesIO()
+    Image.new("RGB", (8, 12), brand_assets.PURPLE).save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+class FakeImagesBackend:
+    """
+    Mimics client.images.edit()
+
+    Parameters:
+    - latency: Seconds each call takes (split across partial frames when streaming)
+    - supports_streaming: False makes stream=True fail like an older SDK
+    - fail_with: Exception instance raised on every call (error-path testing)
+    - fail_times: Raise fail_with on only this many calls, then succeed (retry testing)
+    - render: False returns a tiny placeholder instead of drawing a figure
+    """
+
+    def __init__(self, latency=2.0, supports_streaming=True, fail_with=None, render=True, fail_times=None):
+        self.latency = latency
+        self.supports_streaming = supports_streaming
+        self.fail_with = fail_with
+        self.fail_times = fail_times
+        self.render = render
+        self.calls = 0
+
+    def _should_fail(self):
+        return self.fail_with is not None and (self.fail_times is None or self.calls <= self.fail_times)
+
+    def _frame(self, reference_png, prompt, progress=1.0):
+        if not self.render:
+            return placeholder_png()
+        return render_fake_figure(reference_png, progress, generation.BLANK_HEADER_TEXT in prompt)
+
+    def edit(self, model, image, prompt, size="1024x1536", n=1, stream=False, partial_images=None, **kwargs):
+        self.calls += 1
+        if stream and not self.supports_streaming:
+            raise TypeError("edit() got an unexpected keyword argument 'stream'")
+        if self._should_fail():
+            raise self.fail_with
+
+        reference_png = image.read() if hasattr(image, "read") else image
+        if stream:
+            return self._stream(reference_png, prompt, partial_images or 0)
+
+        time.sleep(self.latency)
+        b64 = base64.b64encode(self._frame(reference_png, prompt)).decode()
+        return SimpleNamespace(data=[SimpleNamespace(url=None, b64_json=b64) for _ in range(n)])
+
+    def _stream(self, reference_png, prompt, partial_images):
+        """Yield partial frames then the final image, like the streaming API"""
+        steps = partial_images + 1
+        for index in range(partial_images):
+            time.sleep(self.latency / steps)
+            frame = self._frame(reference_png, prompt, progress=(index + 1) / steps)
+            yield SimpleNamespace(
+                type="image_edit.partial_image",
+                partial_image_index=index,
+                b64_json=base64.b64encode(frame).decode()
+            )
+        time.sleep(self.latency / steps)
+        yield SimpleNamespace(
+            type="image_edit.completed",
+            b64_json=base64.b64encode(self._frame(reference_png, prompt)).decode()
+        )
+
+
+class FakeAsyncImagesBackend(FakeImagesBackend):
+    """Mimics AsyncOpenAI().images.edit() - awaits instead of blocking"""
+
+    async def edit(self, model, image, prompt, size="1024x1536", n=1, stream=False, partial_images=None, **kwargs):
+        self.calls += 1
+        if stream and not self.supports_streaming:
+            raise TypeError("edit() got an unexpected keyword argument 'stream'")
+        if self._should_fail():
+            raise self.fail_with
+
+        reference_png = image.read() if hasattr(image, "read") else image
+        if stream:
+            return self._stream_async(reference_png, prompt, partial_images or 0)
+
+        await asyncio.sleep(self.latency)
+        b64 = base64.b64encode(self._frame(reference_png, prompt)).decode()
+        return SimpleNamespace(data=[SimpleNamespace(url=None, b64_json=b64) for _ in range(n)])
+
+    async def _stream_async(self, reference_png, prompt, partial_images):
+        steps = partial_images + 1
+        for index in range(partial_images):
+            await asyncio.sleep(self.latency / steps)
+            frame = self._frame(reference_png, prompt, progress=(index + 1) / steps)
+            yield SimpleNamespace(
+                type="image_edit.partial_image",
+                partial_image_index=index,
+                b64_json=base64.b64encode(frame).decode()
+            )
+        await asyncio.sleep(self.latency / steps)
+        yield SimpleNamespace(
+            type="image_edit.completed",
+            b64_json=base64.b64encode(self._frame(reference_png, prompt)).decode()
+        )
+
+
+class FakeModels:
+    """Mimics client.models.retrieve() (used for connection warm-up)"""
+
+    def retrieve(self, model):
+        return SimpleNamespace(id=model)
+
+
+class FakeAsyncModels:
+    """Mimics AsyncOpenAI's client.models.retrieve()"""
+
+    async def retrieve(self, model):
+        return SimpleNamespace(id=model)
+
+
+class FakeOpenAIClient:
+    """Drop-in stand-in for openai.OpenAI with a local images backend"""
+
+    def __init__(self, latency=2.0, supports_streaming=True, fail_with=None, render=True, fail_times=None):
+        self.images = FakeImagesBackend(latency, supports_streaming, fail_with, render, fail_times)
+        self.models = FakeModels()
+
+
+class FakeAsyncOpenAIClient:
+    """Drop-in stand-in for openai.AsyncOpenAI"""
+
+    def __init__(self, latency=2.0, supports_streaming=True, fail_with=None, render=True, fail_times=None):
+        self.images = FakeAsyncImagesBackend(latency, supports_streaming, fail_with, render, fail_times)
+        self.models = FakeAsyncModels()
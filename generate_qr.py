@@ -12,29 +12,23 @@ Requirements:
 
 import qrcode
 
-def generate_qr_code(url, filename="expect_miracles_qr.png", size="standard"):
-    """
-    Generate a QR code with Expect Miracles branding
+# Expect Miracles brand colors (from logo)
+DEEP_BLUE = "#003087"      # Primary blue from logo
+PURPLE = "#7b2c85"         # Purple/magenta accent from logo
+WHITE = "#ffffff"          # Background
 
-    Args:
-        url (str): The Streamlit app URL
-        filename (str): Output filename
-        size (str): 'standard', 'large', or 'poster'
-    """
 
-    # Expect Miracles brand colors (from logo)
-    DEEP_BLUE = "#003087"      # Primary blue from logo
-    PURPLE = "#7b2c85"         # Purple/magenta accent from logo
-    WHITE = "#ffffff"          # Background
+def make_qr_image(url, box_size=10):
+    """
+    Build a branded QR code image in memory
 
-    # Set box size based on desired output
-    size_configs = {
-        "standard": 10,  # ~300px (good for table tents)
-        "large": 20,     # ~600px (good for posters)
-        "poster": 30     # ~900px (good for large prints)
-    }
+    Args:
+        url (str): URL to encode
+        box_size (int): Pixels per QR module
 
-    box_size = size_configs.get(size, 10)
+    Returns:
+        PIL Image of the QR code
+    """
 
     # Create QR code instance
     qr = qrcode.QRCode(
@@ -55,6 +49,28 @@ def generate_qr_code(url, filename="expect_miracles_qr.png", size="standard"):
         back_color=WHITE       # White background
     )
 
+    return img.get_image()
+
+
+def generate_qr_code(url, filename="expect_miracles_qr.png", size="standard"):
+    """
+    Generate a QR code with Expect Miracles branding
+
+    Args:
+        url (str): The Streamlit app URL
+        filename (str): Output filename
+        size (str): 'standard', 'large', or 'poster'
+    """
+
+    # Set box size based on desired output
+    size_configs = {
+        "standard": 10,  # ~300px (good for table tents)
+        "large": 20,     # ~600px (good for posters)
+        "poster": 30     # ~900px (good for large prints)
+    }
+
+    img = make_qr_image(url, box_size=size_configs.get(size, 10))
+
     # Save the image
     img.save(filename)
     print(f"✅ QR code saved as: {filename}")
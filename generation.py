@@ -0,0 +1,489 @@
+"""
+Action Figure Generation Backend
+================================
+Prompt building and the gpt-image-1 images.edit() call, kept free of
+Streamlit so the call can run on scheduler worker threads and be reused
+by command-line tools.
+
+Failures are classified (rate limit, timeout, content policy, bad input,
+server, configuration) and transient ones are retried in place with
+jittered backoff, reusing the already-encoded payload.
+"""
+
+import asyncio
+import base64
+import concurrent.futures
+import random
+import threading
+import time
+from io import BytesIO
+
+import openai
+import requests
+
+import metrics
+
+MODEL = "gpt-image-1"
+IMAGE_SIZE = "1024x1536"
+
+# Partial preview frames requested when streaming (0-3, each costs extra tokens)
+PARTIAL_IMAGES = 2
+
+# Most figures generated per upload for the pick-your-favourite grid (each is a full API call)
+MAX_VARIANTS = 4
+
+# Retries after a transient failure (rate limit, timeout, server error) -
+# clients are built with max_retries=0 so this is the only retry policy
+RETRY_LIMIT = 2
+MAX_RETRIES = 5
+
+# Backoff before retry n is RETRY_BASE_SECONDS * 2**n with 50-100% jitter,
+# capped at RETRY_MAX_SECONDS (a longer Retry-After header is honoured up to the cap)
+RETRY_BASE_SECONDS = 2.0
+RETRY_MAX_SECONDS = 20.0
+
+# Error class -> operator label and whether retrying the same request can succeed
+ERROR_CLASSES = {
+    "rate_limit": {"label": "Rate limit", "transient": True},
+    "timeout": {"label": "Timeout/connection", "transient": True},
+    "server": {"label": "Server error", "transient": True},
+    "content_policy": {"label": "Content policy", "transient": False},
+    "bad_input": {"label": "Bad input", "transient": False},
+    "config": {"label": "API key/quota", "transient": False},
+}
+
+# API error codes for requests rejected by the safety system
+CONTENT_POLICY_CODES = ("moderation_blocked", "content_policy_violation")
+
+# Packaging text requested in the prompt
+TITLE_SUFFIX = "ACTION FIGURE"
+SLOGAN = "I'M TAKING ACTION AGAINST CANCER"
+SCRIPT_TEXT = "Expect Miracles"
+
+# Top share of the image left blank by the model when packaging text is
+# drawn locally instead (see packaging_text.py)
+BLANK_HEADER_FRACTION = 0.25
+BLANK_HEADER_TEXT = "plain deep purple header"
+
+
+def build_full_name(first_name, last_name):
+    """Combine first and optional last name for display"""
+    if last_name.strip():
+        return f"{first_name} {last_name}"
+    return first_name
+
+
+def title_text(full_name):
+    """Packaging title, e.g. 'SARAH JOHNSON: ACTION FIGURE'"""
+    return f"{full_name.upper()}: {TITLE_SUFFIX}"
+
+
+def title_lines(full_name):
+    """Packaging title split over two lines, for names too long for one"""
+    return [f"{full_name.upper()}:", TITLE_SUFFIX]
+
+
+def build_prompt(full_name, accessory, blank_title=False):
+    """
+    Build the gpt-image-1 prompt for an action figure
+
+    Parameters:
+    - full_name: Name shown on the packaging
+    - accessory: User-specified accessories/props (may be empty)
+    - blank_title: Ask for a plain header instead of lettering, so the
+      title, slogan and script can be drawn on locally (packaging_text.py)
+
+    Returns:
+    - prompt string
+    """
+    
+    # Build accessories text based on user input
+    if accessory.strip():
+        accessories_text = f"Include accessories that represent: {accessory}. These should be neatly positioned in the packaging alongside the figure, looking professional and store-ready."
+    else:
+        accessories_text = "No additional accessories are needed - just the figure in confident heroic pose."
+    
+    # Packaging lettering - models misspell names, so it can be left to packaging_text.py
+    if blank_title:
+        lettering_text = f"""- Leave the top {BLANK_HEADER_FRACTION:.0%} of the backing card as a {BLANK_HEADER_TEXT} with NO text, letters, names or logos - the title and slogan are printed there afterwards
+- The plastic blister starts just below that plain header"""
+        font_text = '- Apart from the small "Ages 8+" text and the brand logo, there is no other writing on the packaging'
+    else:
+        lettering_text = f"""- Large, bold title at top: "{title_text(full_name)}" in bold comic-style lettering with metallic blue chrome effect and depth/shadow
+- Below that: "{SLOGAN}" in large white bold comic-style letters
+- Include "{SCRIPT_TEXT}" in elegant italic script below the main message"""
+        font_text = "- The font on the backing card should be bold comic-style lettering throughout"
+    
+    # Create the enhanced prompt with new requirements
+    prompt = f"""Create a realistic, store-ready action figure of a person named {full_name}, based on the uploaded reference image. 
+The final result should look like a premium collectible toy photographed for retail blister packaging.
+
+CRITICAL REQUIREMENTS:
+- Make the photo look as realistic as possible while ensuring the final image is flattering and professional
+- Apply professional photo retouching techniques: optimize lighting, smooth skin naturally, enhance colors, and present the person in their most confident, flattering appearance
+- The figure should look polished and magazine-ready while preserving the person's authentic identity and characteristics
+- Focus on good posture, confident expression, and professional presentation
+- Use a VERTICAL HANGING BLISTER PACK format for the packaging
+- Generate a FULL-BODY action figure showing the person from head to toe, completely contained within the plastic packaging
+
+Packaging Design:
+- VERTICAL portrait orientation with rounded top corners and a hanging hole at the top center
+- The packaging has a clear plastic blister in front and a colorful printed backing card behind
+- The plastic blister must be tall enough to contain the ENTIRE action figure from head to feet with small margins
+- Deep PURPLE background (#7b2c85) as the primary color with BLUE accents on the backing card
+- The background features a bright blue-purple gradient with light rays, glowing energy effects, and star-like sparkles
+- Include small cancer awareness ribbon icons (teal and pink ribbons) subtly placed in the design
+{lettering_text}
+- The plastic blister should have realistic transparency with subtle highlights and reflections showing the contours of the figure inside
+- Add small "Ages 8+" text and a fictional brand logo in bottom corners for authenticity
+{font_text}
+
+Action Figure Details:
+- Show {full_name} as a highly detailed 6-inch scale FULL-BODY action figure inside the clear plastic bubble
+- The figure must be completely visible from head to toe - showing face, torso, legs, and feet
+- Maintain exact facial likeness from the uploaded photo - this is critical
+- The figure should be standing in a natural, confident pose with excellent posture
+- Position the figure centered vertically in the packaging with the head near the top and feet near the bottom
+- Keep them in their actual clothing from the reference photo (business casual, professional attire) - show the complete outfit
+- Include realistic fabric textures, creases, and details on the clothing from head to toe
+- {accessories_text}
+- The accessories should be visible inside the packaging alongside the figure
+- Ensure accurate representation of gender, ethnicity, hair color/style, and all physical characteristics from the reference image
+- Present the figure in the most flattering, confident way possible while maintaining authentic likeness
+- The entire figure (head, body, legs, feet) must fit within the plastic blister boundaries
+
+Photography & Lighting:
+- Professional product photography against a neutral light background (off-white or light gray)
+- Even, soft studio lighting with minimal harsh shadows that naturally flatters the figure
+- Realistic plastic blister reflections and highlights
+- The figure should be well-lit inside the packaging with clear visibility from head to toe
+- Clean, sharp focus throughout - catalog-quality product shot
+- Slight shadow beneath the package to ground it realistically
+- Professional lighting that enhances features and creates a polished, magazine-quality appearance
+- Ensure the full body is evenly lit and clearly visible
+
+Overall Style:
+- Modern collectible toy aesthetic (2020s style, not vintage 1980s)
+- The package should look clean, professional, and ready for retail display
+- Purple and blue color palette throughout, with purple as dominant color
+- Photorealistic finish - should look like an actual product you could buy
+- Make the figure flattering and magazine-ready while maintaining authentic likeness to the reference photo
+- The overall feeling should be inspiring, professional, and polished
+- Everyone should feel proud and excited to share their action figure on social media
+- The complete action figure from head to toe should be the focal point of the image"""
+    
+    return prompt
+
+
+def extract_image_url(response):
+    """
+    Pull the generated image out of an images API response
+
+    Returns:
+    - image URL or base64 data URL, or None if the response has neither
+    """
+    data = response.data[0]
+    if hasattr(data, 'url') and data.url:
+        return data.url
+    if hasattr(data, 'b64_json') and data.b64_json:
+        # Convert base64 to data URL
+        return f"data:image/png;base64,{data.b64_json}"
+    return None
+
+
+def fetch_image_bytes(image_url):
+    """Return the raw PNG bytes for a generated image (data URL or remote URL)"""
+    # Check if it's a data URL (base64)
+    if image_url.startswith('data:image'):
+        # Extract base64 data from data URL
+        base64_data = image_url.split(',', 1)[1]
+        return base64.b64decode(base64_data)
+    
+    # It's a regular URL - download it
+    response = requests.get(image_url, timeout=10)
+    response.raise_for_status()
+    return response.content
+
+
+class GenerationError(Exception):
+    """A generation call that failed for good (after any retries)"""
+
+    def __init__(self, error_class, attempts, cause):
+        self.error_class = error_class
+        self.attempts = attempts
+        super().__init__(f"{ERROR_CLASSES[error_class]['label']} after {attempts} attempt(s): {cause}")
+
+
+def classify_error(error):
+    """
+    Sort a generation failure into one of ERROR_CLASSES
+
+    Anything unrecognised (e.g. a response without an image) counts as a
+    server error, so it is retried.
+    """
+    if isinstance(error, GenerationError):
+        return error.error_class
+    if isinstance(error, (openai.APIConnectionError, TimeoutError, concurrent.futures.TimeoutError, asyncio.TimeoutError)):
+        # APITimeoutError is an APIConnectionError
+        return "timeout"
+
+    status = getattr(error, "status_code", None)
+    code = str(getattr(error, "code", None) or "")
+    if status in (401, 403) or code == "insufficient_quota":
+        return "config"
+    if status == 429:
+        return "rate_limit"
+    if code in CONTENT_POLICY_CODES or "safety system" in str(error).lower():
+        return "content_policy"
+    if status is not None and 400 <= status < 500 and status not in (408, 409):
+        return "bad_input"
+    return "server"
+
+
+def retry_delay(error, attempt):
+    """Jittered exponential backoff before retry number attempt (0-based), in seconds"""
+    delay = RETRY_BASE_SECONDS * 2 ** attempt * random.uniform(0.5, 1.0)
+    response = getattr(error, "response", None)
+    try:
+        delay = max(delay, float(response.headers.get("retry-after")))
+    except (AttributeError, TypeError, ValueError):
+        pass
+    return min(delay, RETRY_MAX_SECONDS)
+
+
+def _backoff_or_raise(error, attempt, retries):
+    """Count a failed attempt; return the wait before the next one or raise GenerationError"""
+    error_class = classify_error(error)
+    metrics.increment(f"generation_errors.{error_class}")
+    if attempt >= retries or not ERROR_CLASSES[error_class]["transient"]:
+        metrics.increment(f"generation_failed.{error_class}")
+        raise GenerationError(error_class, attempt + 1, error) from error
+    metrics.increment(f"generation_retries.{error_class}")
+    return retry_delay(error, attempt)
+
+
+class PartialFrames:
+    """
+    Latest streamed preview frame, shared between a worker thread and the UI
+
+    Only the newest frame is kept; the final image is never stored here.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._frame = None
+        self._count = 0
+
+    def push(self, b64_json, index=None):
+        """Store a partial frame (called from the worker thread)"""
+        frame = base64.b64decode(b64_json)
+        with self._lock:
+            self._frame = frame
+            self._count += 1
+
+    def latest(self):
+        """Return (frames received so far, newest frame bytes or None)"""
+        with self._lock:
+            return self._count, self._frame
+
+
+def _is_streaming_unsupported(error):
+    """True if images.edit() itself rejected the streaming parameters (older SDK or API)"""
+    if isinstance(error, TypeError):
+        # Only an unexpected keyword - any other TypeError is a real bug
+        message = str(error)
+        return "stream" in message or "partial_images" in message
+    return getattr(error, "status_code", None) == 400 and getattr(error, "param", None) in ("stream", "partial_images")
+
+
+def _stream_incomplete():
+    """Error for a stream that ended without the final image (classified as a server error)"""
+    metrics.increment("stream_incomplete")
+    return ValueError("Image stream ended before the final image")
+
+
+def _stream_images_edit(client, img_byte_arr, prompt, on_partial):
+    """
+    Streaming images.edit(): forward each partial frame, return the final image
+
+    Returns:
+    - base64 data URL of the completed image, or None if the SDK or API
+      does not support streaming (the caller falls back to one response)
+
+    Raises:
+    - ValueError if the stream ends early; like any error while iterating
+      (e.g. a mid-stream moderation rejection) it is a real failure for
+      the retry policy, not a reason for a second paid call here
+    """
+    try:
+        stream = client.images.edit(
+            model=MODEL,
+            image=img_byte_arr,
+            prompt=prompt,
+            size=IMAGE_SIZE,
+            n=1,
+            stream=True,
+            partial_images=PARTIAL_IMAGES
+        )
+    except Exception as e:
+        if not _is_streaming_unsupported(e):
+            raise
+        metrics.increment("stream_fallback")
+        return None
+    for event in stream:
+        if event.type == "image_edit.partial_image":
+            metrics.increment("partial_frames")
+            on_partial(event.b64_json, event.partial_image_index)
+        elif event.type == "image_edit.completed":
+            return f"data:image/png;base64,{event.b64_json}"
+    raise _stream_incomplete()
+
+
+def call_images_edit(client, png_bytes, prompt, on_partial=None):
+    """
+    Call OpenAI gpt-image-1 with image editing
+
+    Parameters:
+    - client: OpenAI client (or fake_backend.FakeOpenAIClient)
+    - png_bytes: PNG-encoded reference photo
+    - prompt: prompt from build_prompt()
+    - on_partial: Optional callback(b64_json, index) - when given, the call
+      streams partial preview frames and falls back to a single response
+      only if images.edit() rejects the streaming parameters
+
+    Returns:
+    - image_url: URL or base64 data URL of the generated image
+
+    Raises:
+    - ValueError if the response contains no image or the stream ends early
+    - openai exceptions from the API call
+    """
+    img_byte_arr = BytesIO(png_bytes)
+    
+    # Give the BytesIO object a name attribute so the API recognizes it as a PNG file
+    img_byte_arr.name = "uploaded_image.png"
+    
+    api_start = time.perf_counter()
+    image_url = None
+    
+    if on_partial is not None and PARTIAL_IMAGES > 0:
+        # None means an older SDK or API without streaming - use the single-response path
+        image_url = _stream_images_edit(client, img_byte_arr, prompt, on_partial)
+        
+        # Rewind the upload in case the single-response path below needs it
+        img_byte_arr.seek(0)
+    
+    if image_url is None:
+        response = client.images.edit(
+            model=MODEL,
+            image=img_byte_arr,
+            prompt=prompt,
+            size=IMAGE_SIZE,
+            n=1
+        )
+        image_url = extract_image_url(response)
+    
+    metrics.record_timing("images_edit", time.perf_counter() - api_start)
+    
+    if not image_url:
+        raise ValueError("Could not extract image from response")
+    return image_url
+
+
+def generate_with_retries(client, png_bytes, prompt, on_partial=None, retries=RETRY_LIMIT):
+    """
+    call_images_edit() with transient failures retried in place
+
+    Parameters:
+    - retries: Retries after the first attempt (rate limit, timeout and
+      server errors only); other parameters as for call_images_edit()
+
+    Returns:
+    - image_url: URL or base64 data URL of the generated image
+
+    Raises:
+    - GenerationError with the error class once retries are exhausted or
+      the failure is not transient
+    """
+    for attempt in range(retries + 1):
+        try:
+            image_url = call_images_edit(client, png_bytes, prompt, on_partial)
+        except Exception as e:
+            time.sleep(_backoff_or_raise(e, attempt, retries))
+            continue
+        if attempt:
+            metrics.increment("generation_recovered")
+        return image_url
+
+
+async def _stream_images_edit_async(client, img_byte_arr, prompt, on_partial):
+    """Async twin of _stream_images_edit()"""
+    try:
+        stream = await client.images.edit(
+            model=MODEL,
+            image=img_byte_arr,
+            prompt=prompt,
+            size=IMAGE_SIZE,
+            n=1,
+            stream=True,
+            partial_images=PARTIAL_IMAGES
+        )
+    except Exception as e:
+        if not _is_streaming_unsupported(e):
+            raise
+        metrics.increment("stream_fallback")
+        return None
+    async for event in stream:
+        if event.type == "image_edit.partial_image":
+            metrics.increment("partial_frames")
+            on_partial(event.b64_json, event.partial_image_index)
+        elif event.type == "image_edit.completed":
+            return f"data:image/png;base64,{event.b64_json}"
+    raise _stream_incomplete()
+
+
+async def call_images_edit_async(client, png_bytes, prompt, on_partial=None):
+    """
+    Async version of call_images_edit() for openai.AsyncOpenAI
+
+    Same parameters, return value and streaming fallback; used by the
+    asyncio generation engine so one event loop can hold many calls.
+    """
+    img_byte_arr = BytesIO(png_bytes)
+    img_byte_arr.name = "uploaded_image.png"
+    
+    api_start = time.perf_counter()
+    image_url = None
+    
+    if on_partial is not None and PARTIAL_IMAGES > 0:
+        image_url = await _stream_images_edit_async(client, img_byte_arr, prompt, on_partial)
+        img_byte_arr.seek(0)
+    
+    if image_url is None:
+        response = await client.images.edit(
+            model=MODEL,
+            image=img_byte_arr,
+            prompt=prompt,
+            size=IMAGE_SIZE,
+            n=1
+        )
+        image_url = extract_image_url(response)
+    
+    metrics.record_timing("images_edit", time.perf_counter() - api_start)
+    
+    if not image_url:
+        raise ValueError("Could not extract image from response")
+    return image_url
+
+
+async def generate_with_retries_async(client, png_bytes, prompt, on_partial=None, retries=RETRY_LIMIT):
+    """Async version of generate_with_retries() - backs off without blocking the event loop"""
+    for attempt in range(retries + 1):
+        try:
+            image_url = await call_images_edit_async(client, png_bytes, prompt, on_partial)
+        except Exception as e:
+            await asyncio.sleep(_backoff_or_raise(e, attempt, retries))
+            continue
+        if attempt:
+            metrics.increment("generation_recovered")
+        return image_url
@@ -0,0 +1,331 @@
+"""
+Instant Action Figure Renderer (CPU Fallback)
+=============================================
+Builds an action figure locally in well under a second when the images API
+is down or the queue is full, so nobody leaves empty-handed.
+
+The purple blister-pack card (backing, rays, sparkles, plastic bubble,
+slogan and script text) is drawn once and cached. Per figure the work is:
+
+1. Cut the person out of the photo with a colour-key against the
+   background estimated from the photo edges, limited to a head-and-
+   shoulders prior (falls back to a soft vignette on busy backgrounds)
+2. Crop to the person and paste them into the bubble
+3. Draw the auto-fitted "{NAME}: ACTION FIGURE" title and encode the PNG
+
+Usage:
+    python instant_figure.py photo.jpg "Sarah Johnson" --accessory "golf club"
+    python instant_figure.py photo.jpg "Sarah Johnson" --repeat 50
+"""
+
+import argparse
+import random
+import time
+from functools import lru_cache
+from io import BytesIO
+
+from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageOps, ImageStat
+
+import brand_assets
+import generation
+import metrics
+
+OUTPUT_SIZE = (1024, 1536)
+
+# Backing card and the clear plastic bubble on it (left, top, right, bottom)
+CARD_BOX = (40, 40, 984, 1496)
+BUBBLE_BOX = (150, 360, 874, 1290)
+TITLE_BOX = (90, 110, 934, 230)
+
+LIGHT_PURPLE = (176, 120, 196)
+
+# Photo is segmented at this size; the mask is scaled back up afterwards
+MASK_SIDE = 192
+
+# Per-pixel colour distance from the background that counts as "person"
+KEY_THRESHOLD = 40
+
+# Above this foreground share the background is too busy to colour-key
+BUSY_BACKGROUND = 0.7
+
+# Fast PNG: the result is re-encoded by post-processing anyway
+PNG_COMPRESS_LEVEL = 1
+
+
+# ============================================================================
+# TEMPLATE (built once per process)
+# ============================================================================
+def _vertical_gradient(size, top, bottom):
+    """RGB gradient from top color to bottom color"""
+    ramp = Image.linear_gradient("L").resize(size)
+    return Image.composite(Image.new("RGB", size, bottom), Image.new("RGB", size, top), ramp)
+
+
+@lru_cache(maxsize=1)
+def blister_template():
+    """
+    The empty blister pack: card, rays, sparkles, bubble tray and fixed text
+
+    Returns:
+    - RGB PIL Image at OUTPUT_SIZE (copy before drawing on it)
+    """
+    canvas = Image.new("RGB", OUTPUT_SIZE, (236, 236, 240))
+
+    # Backing card: purple into blue, rounded top corners with a hanging hole
+    card_size = (CARD_BOX[2] - CARD_BOX[0], CARD_BOX[3] - CARD_BOX[1])
+    card = _vertical_gradient(card_size, brand_assets.PURPLE, brand_assets.NAVY)
+    card_mask = Image.new("L", card_size, 0)
+    ImageDraw.Draw(card_mask).rounded_rectangle((0, 0, card_size[0] - 1, card_size[1] + 60), radius=60, fill=255)
+
+    # Light rays and sparkles behind the bubble
+    rays = Image.new("L", card_size, 0)
+    draw = ImageDraw.Draw(rays)
+    center = (card_size[0] / 2, 700)
+    for index in range(18):
+        angle = index * 20
+        draw.pieslice((center[0] - 1400, center[1] - 1400, center[0] + 1400, center[1] + 1400),
+                      angle, angle + 8, fill=36)
+    card = Image.composite(Image.new("RGB", card_size, brand_assets.BLUE), card, rays.filter(ImageFilter.GaussianBlur(12)))
+
+    draw = ImageDraw.Draw(card)
+    sparkle_random = random.Random(7)
+    for _ in range(70):
+        x, y = sparkle_random.randrange(card_size[0]), sparkle_random.randrange(card_size[1])
+        if TITLE_BOX[1] - CARD_BOX[1] - 20 < y < 340 - CARD_BOX[1]:
+            continue  # keep the lettering clean
+        radius = sparkle_random.choice((2, 2, 3, 4))
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=(255, 244, 200))
+
+    # Hanging hole
+    hole_center = card_size[0] // 2
+    draw.rounded_rectangle((hole_center - 70, 14, hole_center + 70, 44), radius=15, fill=(236, 236, 240))
+
+    canvas.paste(card, CARD_BOX[:2], card_mask)
+    draw = ImageDraw.Draw(canvas)
+
+    # Bubble tray: lighter purple behind the figure
+    bubble_size = (BUBBLE_BOX[2] - BUBBLE_BOX[0], BUBBLE_BOX[3] - BUBBLE_BOX[1])
+    tray = _vertical_gradient(bubble_size, LIGHT_PURPLE, brand_assets.PURPLE)
+    tray_mask = _bubble_mask(bubble_size)
+    canvas.paste(tray, BUBBLE_BOX[:2], tray_mask)
+
+    # Fixed packaging text from the prompt
+    slogan_font = brand_assets.fit_font(generation.SLOGAN, TITLE_BOX[2] - TITLE_BOX[0], "bold", 56, 28)
+    draw.text((OUTPUT_SIZE[0] / 2, 300), generation.SLOGAN, font=slogan_font, fill=brand_assets.WHITE,
+              anchor="mm", stroke_width=3, stroke_fill=brand_assets.DEEP_PURPLE)
+    draw.text((OUTPUT_SIZE[0] / 2, 1350), generation.SCRIPT_TEXT, font=brand_assets.load_font(64, "script"),
+              fill=brand_assets.GOLD, anchor="mm", stroke_width=2, stroke_fill=brand_assets.DEEP_PURPLE)
+    draw.text((80, 1455), "Ages 8+", font=brand_assets.load_font(24, "bold"), fill=brand_assets.WHITE, anchor="lm")
+    logo = brand_assets.load_logo(64)
+    canvas.paste(logo, (CARD_BOX[2] - logo.width - 30, CARD_BOX[3] - logo.height - 20), logo)
+    return canvas
+
+
+def _bubble_mask(size):
+    """Rounded-rectangle alpha mask for the plastic bubble"""
+    mask = Image.new("L", size, 0)
+    ImageDraw.Draw(mask).rounded_rectangle((0, 0, size[0] - 1, size[1] - 1), radius=70, fill=255)
+    return mask
+
+
+@lru_cache(maxsize=1)
+def plastic_overlay():
+    """
+    RGBA layer with the bubble's rim and glossy highlights
+
+    Returns:
+    - RGBA PIL Image the size of BUBBLE_BOX
+    """
+    size = (BUBBLE_BOX[2] - BUBBLE_BOX[0], BUBBLE_BOX[3] - BUBBLE_BOX[1])
+    layer = Image.new("RGBA", size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(layer)
+    draw.rounded_rectangle((0, 0, size[0] - 1, size[1] - 1), radius=70, outline=(255, 255, 255, 170), width=8)
+    draw.rounded_rectangle((10, 10, size[0] - 11, size[1] - 11), radius=62, outline=(255, 255, 255, 60), width=3)
+
+    # Diagonal glare stripes
+    glare = Image.new("L", size, 0)
+    glare_draw = ImageDraw.Draw(glare)
+    glare_draw.polygon([(40, 0), (150, 0), (0, 260), (0, 70)], fill=70)
+    glare_draw.polygon([(size[0] - 60, size[1] - 320), (size[0], size[1] - 420), (size[0], size[1] - 360),
+                        (size[0] - 60, size[1] - 250)], fill=45)
+    glare = ImageChops.multiply(glare.filter(ImageFilter.GaussianBlur(6)), _bubble_mask(size))
+    layer.alpha_composite(Image.merge("RGBA", (*Image.new("RGB", size, brand_assets.WHITE).split(), glare)))
+    return layer
+
+
+# ============================================================================
+# PERSON CUT-OUT
+# ============================================================================
+@lru_cache(maxsize=8)
+def _person_prior(size, scale):
+    """
+    Head-and-shoulders shape as a mask (cached per size)
+
+    Parameters:
+    - size: (width, height) of the working image
+    - scale: 1.0 is a typical portrait; larger is more permissive
+    """
+    width, height = size
+    prior = Image.new("L", size, 0)
+    draw = ImageDraw.Draw(prior)
+    head = (0.5 * width, 0.38 * height, 0.24 * width * scale, 0.27 * height * scale)
+    shoulders = (0.5 * width, 1.08 * height, 0.52 * width * scale, 0.5 * height * scale)
+    for cx, cy, rx, ry in (head, shoulders):
+        draw.ellipse((cx - rx, cy - ry, cx + rx, cy + ry), fill=255)
+    neck_half_width = 0.11 * width * scale
+    draw.rectangle((0.5 * width - neck_half_width, 0.45 * height, 0.5 * width + neck_half_width, 0.75 * height), fill=255)
+    return prior.filter(ImageFilter.GaussianBlur(max(1, width // 40)))
+
+
+@lru_cache(maxsize=8)
+def _vignette(size):
+    """Soft oval over the middle of the frame (cached per size)"""
+    width, height = size
+    vignette = Image.new("L", size, 0)
+    ImageDraw.Draw(vignette).ellipse((0.1 * width, 0.05 * height, 0.9 * width, 1.35 * height), fill=255)
+    return vignette.filter(ImageFilter.GaussianBlur(max(1, width // 20)))
+
+
+def _background_color(image):
+    """Median color of the top and side edges (the body usually reaches the bottom)"""
+    width, height = image.size
+    border = max(2, width // 16)
+    strips = [image.crop((0, 0, width, border)), image.crop((0, 0, border, height)),
+              image.crop((width - border, 0, width, height))]
+    medians = [ImageStat.Stat(strip).median for strip in strips]
+    return tuple(sorted(band)[1] for band in zip(*medians))
+
+
+def person_mask(photo):
+    """
+    Estimate which pixels of a portrait belong to the person
+
+    Parameters:
+    - photo: RGB PIL Image
+
+    Returns:
+    - L-mode mask at working size (MASK_SIDE on the long edge, same aspect
+      as photo; 255 = person), feathered at the edges
+    """
+    small = photo.copy()
+    small.thumbnail((MASK_SIDE, MASK_SIDE), Image.BILINEAR)
+
+    distance = ImageChops.difference(small, Image.new("RGB", small.size, _background_color(small)))
+    # Largest per-channel difference - a colored shirt on grey still stands out
+    distance = ImageChops.lighter(ImageChops.lighter(*distance.split()[:2]), distance.split()[2])
+    foreground = distance.point([0] * KEY_THRESHOLD + [255] * (256 - KEY_THRESHOLD))
+
+    if ImageStat.Stat(foreground).mean[0] / 255 > BUSY_BACKGROUND:
+        # Background is as colourful as the person - use a soft vignette instead
+        mask = _vignette(small.size)
+    else:
+        mask = ImageChops.multiply(foreground, _person_prior(small.size, 1.4))
+        mask = ImageChops.lighter(mask, _person_prior(small.size, 0.6))
+        # Remove speckles, then close small holes (opening then closing)
+        mask = mask.filter(ImageFilter.MinFilter(3)).filter(ImageFilter.MaxFilter(3))
+        mask = mask.filter(ImageFilter.MaxFilter(5)).filter(ImageFilter.MinFilter(5))
+        mask = mask.filter(ImageFilter.GaussianBlur(1.5))
+    return mask
+
+
+# ============================================================================
+# RENDERING
+# ============================================================================
+def _fit_person(photo, mask):
+    """
+    Crop to the person and scale to fill the bubble
+
+    The photo and the small mask are each resized once, straight from the
+    crop box to the final size.
+    """
+    box = mask.point([0] * 128 + [255] * 128).getbbox() or (0, 0) + mask.size
+    ratio = photo.width / mask.width
+    photo_box = tuple(round(edge * ratio) for edge in box)
+    crop_width, crop_height = photo_box[2] - photo_box[0], photo_box[3] - photo_box[1]
+
+    bubble_width = BUBBLE_BOX[2] - BUBBLE_BOX[0] - 60
+    bubble_height = BUBBLE_BOX[3] - BUBBLE_BOX[1] - 40
+    scale = min(bubble_width / crop_width, bubble_height / crop_height)
+    size = (max(1, int(crop_width * scale)), max(1, int(crop_height * scale)))
+    return (photo.resize(size, Image.BILINEAR, box=photo_box, reducing_gap=2.0),
+            mask.resize(size, Image.BILINEAR, box=box))
+
+
+def render_figure(photo, full_name, accessory=""):
+    """
+    Build an instant action figure
+
+    Parameters:
+    - photo: PIL Image of the attendee (any mode; EXIF orientation applied)
+    - full_name: Name for the packaging title
+    - accessory: Optional accessories, listed on the card
+
+    Returns:
+    - PNG bytes at OUTPUT_SIZE
+    """
+    start = time.perf_counter()
+    photo = ImageOps.exif_transpose(photo).convert("RGB")
+
+    figure, mask = _fit_person(photo, person_mask(photo))
+    canvas = blister_template().copy()
+
+    # Person inside the bubble, clipped to its rounded outline
+    left = BUBBLE_BOX[0] + (BUBBLE_BOX[2] - BUBBLE_BOX[0] - figure.width) // 2
+    top = BUBBLE_BOX[3] - 20 - figure.height
+    bubble_mask = _bubble_mask((BUBBLE_BOX[2] - BUBBLE_BOX[0], BUBBLE_BOX[3] - BUBBLE_BOX[1]))
+    clip = bubble_mask.crop((left - BUBBLE_BOX[0], top - BUBBLE_BOX[1],
+                             left - BUBBLE_BOX[0] + figure.width, top - BUBBLE_BOX[1] + figure.height))
+    canvas.paste(figure, (left, top), ImageChops.multiply(mask, clip))
+
+    # Plastic rim and glare over the figure
+    bubble = canvas.crop(BUBBLE_BOX).convert("RGBA")
+    bubble.alpha_composite(plastic_overlay())
+    canvas.paste(bubble.convert("RGB"), BUBBLE_BOX[:2], bubble_mask)
+
+    # Title and accessories
+    draw = ImageDraw.Draw(canvas)
+    brand_assets.draw_title(draw, generation.title_text(full_name), generation.title_lines(full_name), TITLE_BOX)
+    if accessory.strip():
+        includes = f"INCLUDES: {accessory.strip().upper()}"
+        includes_font = brand_assets.fit_font(includes, BUBBLE_BOX[2] - BUBBLE_BOX[0], "bold", 30, 16)
+        draw.text((OUTPUT_SIZE[0] / 2, 1412), includes, font=includes_font, fill=brand_assets.WHITE, anchor="mm")
+
+    buffered = BytesIO()
+    canvas.save(buffered, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
+    metrics.record_timing("instant_figure", time.perf_counter() - start)
+    return buffered.getvalue()
+
+
+def preload():
+    """Build the cached template and overlay ahead of the first figure"""
+    blister_template()
+    plastic_overlay()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render an instant action figure without the images API")
+    parser.add_argument("photo", help="Photo of the attendee")
+    parser.add_argument("name", help="Name for the packaging title")
+    parser.add_argument("--accessory", default="", help="Accessories listed on the card")
+    parser.add_argument("--output", default="instant_figure.png", help="Where to write the PNG")
+    parser.add_argument("--repeat", type=int, default=1, help="Render this many times and report throughput")
+    args = parser.parse_args()
+
+    photo = Image.open(args.photo)
+    photo.load()
+
+    preload()
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        png_bytes = render_figure(photo, args.name, args.accessory)
+    elapsed = time.perf_counter() - start
+
+    with open(args.output, "wb") as f:
+        f.write(png_bytes)
+
+    print(f"✅ Saved: {args.output}")
+    print(f"⚡ {elapsed / args.repeat * 1000:.0f} ms per figure ({args.repeat / elapsed:.1f} figures/s on one core)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Runtime Metrics for Expect Miracles App
+=======================================
+Thread-safe counters and timing summaries shared by every session in the
+Streamlit process. Used to measure latency savings and error rates during
+live events without any external monitoring service.
+
+Usage:
+    import metrics
+    metrics.increment("generations_started")
+    metrics.record_timing("upload_prep", 0.42)
+    print(metrics.snapshot())
+"""
+
+import threading
+from collections import deque
+
+# Keep only the most recent samples per timing so memory stays bounded
+MAX_SAMPLES = 1000
+
+_lock = threading.Lock()
+_counters = {}
+_timings = {}
+
+
+def increment(name, amount=1):
+    """Add amount to a named counter"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def record_timing(name, seconds):
+    """Record one timing sample (in seconds) under a name"""
+    record_sample(name, seconds)
+
+
+def record_sample(name, value):
+    """Record one sample of any measured quantity (e.g. bytes sent per rerun)"""
+    with _lock:
+        samples = _timings.get(name)
+        if samples is None:
+            samples = deque(maxlen=MAX_SAMPLES)
+            _timings[name] = samples
+        samples.append(float(value))
+
+
+def _percentile(sorted_samples, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(fraction * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def summarize(samples):
+    """Summarize a list of timing samples as count/mean/p50/p95/max"""
+    ordered = sorted(samples)
+    count = len(ordered)
+    return {
+        "count": count,
+        "mean": sum(ordered) / count if count else 0.0,
+        "p50": _percentile(ordered, 0.50),
+        "p95": _percentile(ordered, 0.95),
+        "max": ordered[-1] if ordered else 0.0,
+    }
+
+
+def snapshot():
+    """
+    Return a copy of all metrics
+
+    Returns:
+    - dict with 'counters' (name -> value) and 'timings' (name -> summary
+      of the samples recorded with record_timing() or record_sample())
+    """
+    with _lock:
+        counters = dict(_counters)
+        timings = {name: list(samples) for name, samples in _timings.items()}
+    return {
+        "counters": counters,
+        "timings": {name: summarize(samples) for name, samples in timings.items()},
+    }
+
+
+def reset():
+    """Clear all counters and timings (used by benchmarks and self-tests)"""
+    with _lock:
+        _counters.clear()
+        _timings.clear()
@@ -0,0 +1,164 @@
+"""
+Local Packaging Text for Action Figures
+=======================================
+Image models misspell names often enough that attendees regenerate, paying
+for another 60-90 second call. With local titles the prompt asks for a
+plain header (generation.build_prompt(..., blank_title=True)) and the
+name, slogan and "Expect Miracles" script are drawn here instead.
+
+The slogan and script never change, so they are rendered once per image
+size into a cached transparent layer. Per figure the work is one auto-fitted
+title (cached fonts from brand_assets), compositing the header strip only
+and re-encoding the PNG.
+
+Usage:
+    LOCAL_TITLES=1 streamlit run app.py
+
+    python packaging_text.py figure.png "Sarah Johnson" --repeat 50
+"""
+
+import argparse
+import time
+from functools import lru_cache
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+import brand_assets
+import generation
+import metrics
+
+# Header layout as fractions of the image height (the header itself is
+# generation.BLANK_HEADER_FRACTION of the image)
+TITLE_TOP = 0.04
+TITLE_BOTTOM = 0.13
+SLOGAN_CENTER = 0.165
+SCRIPT_CENTER = 0.215
+
+# Horizontal margin for all lettering, as a fraction of the image width
+SIDE_MARGIN = 0.06
+
+# Speed over size - the result is re-encoded once per figure
+PNG_COMPRESS_LEVEL = 1
+
+
+def header_height(height):
+    """Pixel height of the blank header the model was asked to leave"""
+    return int(height * generation.BLANK_HEADER_FRACTION)
+
+
+def title_box(width, height):
+    """(left, top, right, bottom) the title is fitted into"""
+    margin = int(width * SIDE_MARGIN)
+    return (margin, int(height * TITLE_TOP), width - margin, int(height * TITLE_BOTTOM))
+
+
+@lru_cache(maxsize=8)
+def header_layer(width, height):
+    """
+    Transparent RGBA header strip with the slogan and script (cached per size)
+
+    Parameters:
+    - width, height: Size of the whole figure image
+    """
+    layer = Image.new("RGBA", (width, header_height(height)), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(layer)
+    max_width = width - 2 * int(width * SIDE_MARGIN)
+
+    slogan_font = brand_assets.fit_font(generation.SLOGAN, max_width, "bold", 56, 28)
+    draw.text((width / 2, height * SLOGAN_CENTER), generation.SLOGAN, font=slogan_font,
+              fill=brand_assets.WHITE + (255,), anchor="mm", stroke_width=3,
+              stroke_fill=brand_assets.DEEP_PURPLE + (255,))
+
+    script_font = brand_assets.fit_font(generation.SCRIPT_TEXT, max_width, "script", 64, 32)
+    draw.text((width / 2, height * SCRIPT_CENTER), generation.SCRIPT_TEXT, font=script_font,
+              fill=brand_assets.GOLD + (255,), anchor="mm", stroke_width=2,
+              stroke_fill=brand_assets.DEEP_PURPLE + (255,))
+    return layer
+
+
+def add_packaging_text(image, full_name):
+    """
+    Draw the title, slogan and script into the header of a figure
+
+    Parameters:
+    - image: PIL Image generated with a blank header
+    - full_name: Name for the '{NAME}: ACTION FIGURE' title
+
+    Returns:
+    - RGB PIL Image (a new image; the input is left untouched)
+    """
+    image = image.convert("RGB") if image.mode != "RGB" else image.copy()
+    width, height = image.size
+
+    # Only the header strip is converted and composited
+    header = image.crop((0, 0, width, header_height(height))).convert("RGBA")
+    header.alpha_composite(header_layer(width, height))
+    header = header.convert("RGB")
+    brand_assets.draw_title(ImageDraw.Draw(header), generation.title_text(full_name),
+                            generation.title_lines(full_name), title_box(width, height))
+
+    image.paste(header, (0, 0))
+    return image
+
+
+def titled_png(image_bytes, full_name):
+    """
+    Add the packaging text to a generated figure
+
+    Parameters:
+    - image_bytes: PNG bytes from the images API (blank header)
+    - full_name: Name for the title
+
+    Returns:
+    - PNG bytes of the finished figure
+    """
+    start = time.perf_counter()
+    image = add_packaging_text(Image.open(BytesIO(image_bytes)), full_name)
+
+    buffered = BytesIO()
+    image.save(buffered, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
+    metrics.record_timing("packaging_text", time.perf_counter() - start)
+    return buffered.getvalue()
+
+
+def preload(sizes=((1024, 1536),)):
+    """Build the cached header layers ahead of the first figure"""
+    for width, height in sizes:
+        header_layer(width, height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Draw the packaging title, slogan and script onto a figure")
+    parser.add_argument("image", help="Figure generated with a blank header")
+    parser.add_argument("name", help="Name for the packaging title")
+    parser.add_argument("--output", default="titled_figure.png", help="Where to write the PNG")
+    parser.add_argument("--repeat", type=int, default=1, help="Run this many times and report the cost")
+    args = parser.parse_args()
+
+    with open(args.image, "rb") as f:
+        image_bytes = f.read()
+
+    preload()
+    image = Image.open(BytesIO(image_bytes))
+    image.load()
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        add_packaging_text(image, args.name)
+    draw_seconds = (time.perf_counter() - start) / args.repeat
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        png_bytes = titled_png(image_bytes, args.name)
+    total_seconds = (time.perf_counter() - start) / args.repeat
+
+    with open(args.output, "wb") as f:
+        f.write(png_bytes)
+
+    print(f"✅ Saved: {args.output}")
+    print(f"⚡ {draw_seconds * 1000:.1f} ms lettering, {total_seconds * 1000:.0f} ms including decode and PNG encode")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Pickup Store for Kiosk Mode
+===========================
+Kiosk iPads queue a generation and immediately reset for the next attendee.
+Each job gets a short pickup code; finished figures are collected later on a
+separate display screen or by scanning a QR code that opens ?pickup=<code>.
+
+The store is in memory and shared by every session in the Streamlit process.
+Old entries are dropped so memory stays bounded during long events.
+"""
+
+import secrets
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image
+
+import export_results
+import generation
+import metrics
+import packaging_text
+import postprocess
+from scheduler import CODE_ALPHABET
+
+# Keep at most this many jobs, and none older than PICKUP_TTL_SECONDS
+MAX_PICKUPS = 300
+PICKUP_TTL_SECONDS = 6 * 60 * 60
+
+PICKUP_CODE_LENGTH = 5
+
+# Bounding box of the JPEG shown on the pickup display grid
+THUMBNAIL_SIZE = (512, 768)
+
+# Finishes jobs from the asyncio engine (lettering, saving, share formats)
+# so that work never runs on the engine's event loop
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pickup")
+
+
+class PickupStore:
+    """Thread-safe map of pickup code -> job record"""
+
+    def __init__(self, max_items=MAX_PICKUPS, ttl_seconds=PICKUP_TTL_SECONDS):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._items = {}
+
+    def create(self, first_name, last_name, accessory):
+        """
+        Register a new job
+
+        Returns:
+        - pickup code (str)
+        """
+        with self._lock:
+            self._expire_locked()
+            code = self._new_code_locked()
+            self._items[code] = {
+                "code": code,
+                "first_name": first_name,
+                "last_name": last_name,
+                "accessory": accessory,
+                "status": "queued",
+                "image_bytes": None,
+                "thumbnail": None,
+                "error": None,
+                "created_at": time.time(),
+                "finished_at": None,
+            }
+        return code
+
+    def update(self, code, **fields):
+        """Update fields of an existing job (ignored if it has expired)"""
+        with self._lock:
+            if code in self._items:
+                self._items[code].update(fields)
+
+    def get(self, code):
+        """Return a copy of the job record, or None for unknown codes"""
+        if not code:
+            return None
+        with self._lock:
+            record = self._items.get(code.strip().upper())
+            return dict(record) if record else None
+
+    def remove(self, code):
+        """Forget a job (e.g. it was never admitted to the queue)"""
+        with self._lock:
+            self._items.pop(code, None)
+
+    def recent(self, status=None, limit=12):
+        """Most recently created jobs first, optionally filtered by status"""
+        with self._lock:
+            records = [dict(r) for r in self._items.values() if status is None or r["status"] == status]
+        records.sort(key=lambda r: r["created_at"], reverse=True)
+        return records[:limit]
+
+    def _new_code_locked(self):
+        while True:
+            code = "".join(secrets.choice(CODE_ALPHABET) for _ in range(PICKUP_CODE_LENGTH))
+            if code not in self._items:
+                return code
+
+    def _expire_locked(self):
+        cutoff = time.time() - self.ttl_seconds
+        for code in [c for c, r in self._items.items() if r["created_at"] < cutoff]:
+            del self._items[code]
+
+        # Drop the oldest entries if we are still over the limit
+        overflow = len(self._items) - self.max_items + 1
+        if overflow > 0:
+            oldest = sorted(self._items.values(), key=lambda r: r["created_at"])[:overflow]
+            for record in oldest:
+                del self._items[record["code"]]
+
+
+def _add_title(image_bytes, title_name):
+    """Draw the packaging text onto a figure generated with a blank header"""
+    try:
+        return packaging_text.titled_png(image_bytes, title_name)
+    except Exception:
+        # A figure without lettering still beats no figure
+        metrics.increment("packaging_text_failed")
+        return image_bytes
+
+
+def _thumbnail(image_bytes):
+    """Small JPEG of a figure for the display grid, which refreshes every few seconds"""
+    image = Image.open(BytesIO(image_bytes)).convert("RGB")
+    image.thumbnail(THUMBNAIL_SIZE)
+    buffered = BytesIO()
+    image.save(buffered, format="JPEG", quality=85)
+    return buffered.getvalue()
+
+
+def _record_success(store, code, image_url, caption, save_dir, title_name=None):
+    """Mark a job done, then save it and queue share formats if requested"""
+    # Decode once here - the display grid and pickup page get bytes, not data URLs
+    image_bytes = generation.fetch_image_bytes(image_url)
+    if title_name:
+        image_bytes = _add_title(image_bytes, title_name)
+    store.update(code, status="done", image_bytes=image_bytes, thumbnail=_thumbnail(image_bytes),
+                 finished_at=time.time())
+    if caption or save_dir:
+        try:
+            if save_dir:
+                record = store.get(code) or {}
+                export_results.save_result(
+                    image_bytes,
+                    record.get("first_name", ""),
+                    record.get("last_name", ""),
+                    record.get("accessory", ""),
+                    directory=save_dir
+                )
+            if caption:
+                store.update(code, variants_job=postprocess.submit(image_bytes, caption))
+        except Exception:
+            # Saving and share formats are optional - the pickup page still offers the original
+            metrics.increment("postprocess_failed")
+    metrics.increment("kiosk_completed")
+    return image_bytes
+
+
+def _record_failure(store, code, error):
+    store.update(code, status="failed", error=str(error), finished_at=time.time())
+    metrics.increment("kiosk_failed")
+
+
+def run_pickup_job(store, code, generate, prepared_future, prompt, caption=None, save_dir=None, title_name=None,
+                   returns_future=False):
+    """
+    Scheduler job for kiosk submissions
+
+    Waits for the background upload preparation, starts the generation and
+    records the outcome in the store so the display screen can pick it up.
+    With a caption, the stamped share variants are queued for
+    post-processing as well; with save_dir, the figure is saved for export.
+
+    Parameters:
+    - generate: Callable(png_bytes, prompt) returning an image URL, or a
+      Future of one when the asyncio engine is in use
+    - title_name: Name to draw onto a figure generated with a blank header
+      (local titles), or None when the model lettered it
+    - returns_future: True when generate returns a Future (asyncio engine).
+      The job then returns at once instead of blocking the scheduler's
+      single dispatcher thread on the upload preparation
+
+    Returns:
+    - PNG bytes of the finished figure, or a Future of them
+    """
+    store.update(code, status="running")
+    if returns_future:
+        return _chain_pickup_job(store, code, generate, prepared_future, prompt, caption, save_dir, title_name)
+
+    try:
+        prepared = prepared_future.result()
+        image_url = generate(prepared["png_bytes"], prompt)
+        return _record_success(store, code, image_url, caption, save_dir, title_name)
+    except Exception as e:
+        _record_failure(store, code, e)
+        raise
+
+
+def _chain_pickup_job(store, code, generate, prepared_future, prompt, caption, save_dir, title_name):
+    """Non-blocking run_pickup_job(): upload prep -> generation -> bookkeeping, chained by callbacks"""
+    outer = Future()
+
+    def fail(error):
+        _record_failure(store, code, error)
+        outer.set_exception(error)
+
+    def finish(image_url):
+        # Runs in the pickup pool, off the engine's event loop
+        try:
+            outer.set_result(_record_success(store, code, image_url, caption, save_dir, title_name))
+        except Exception as e:
+            fail(e)
+
+    def on_generated(inner):
+        error = inner.exception()
+        if error is not None:
+            fail(error)
+        else:
+            _executor.submit(finish, inner.result())
+
+    def on_prepared(prepared):
+        # Called on the upload-prep thread (or right here if prep already finished)
+        try:
+            result = generate(prepared.result()["png_bytes"], prompt)
+        except Exception as e:
+            fail(e)
+            return
+        if isinstance(result, Future):
+            result.add_done_callback(on_generated)
+        else:
+            _executor.submit(finish, result)
+
+    prepared_future.add_done_callback(on_prepared)
+    return outer
@@ -0,0 +1,158 @@
+"""
+Result Post-Processing for Expect Miracles App
+==============================================
+Runs once per generated figure in a small worker pool, off the Streamlit
+request thread:
+
+1. Crops/pads the 1024x1536 portrait into share variants
+   (portrait, square for Instagram, 9:16 story)
+2. Stamps each variant with the event name/date band and logo
+3. Encodes every variant as PNG, JPEG and WebP
+
+Overlay layers are built once per size and caption and cached, so each
+figure only pays for compositing and encoding.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+import brand_assets
+import metrics
+
+# Variant name -> (width, height, label)
+VARIANTS = {
+    "portrait": (1024, 1536, "Portrait"),
+    "square": (1080, 1080, "Square (Instagram)"),
+    "story": (1080, 1920, "Story"),
+}
+
+# Format name -> (PIL save kwargs, MIME type, file extension)
+FORMATS = {
+    "PNG": ({"format": "PNG"}, "image/png", "png"),
+    "JPEG": ({"format": "JPEG", "quality": 90}, "image/jpeg", "jpg"),
+    "WEBP": ({"format": "WEBP", "quality": 85, "method": 4}, "image/webp", "webp"),
+}
+
+# Height of the caption band at the bottom, as a fraction of image height
+BAND_FRACTION = 0.06
+
+# Where the square crop sits vertically (0 = top, 1 = bottom); slightly
+# above center keeps the figure's face and the title in frame
+SQUARE_CROP_BIAS = 0.35
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="postprocess")
+
+
+@lru_cache(maxsize=32)
+def overlay_layer(width, height, caption):
+    """
+    Transparent RGBA layer with the caption band and logo (cached per size/caption)
+
+    Parameters:
+    - width, height: Size of the image being stamped
+    - caption: Text for the band, e.g. 'Expect Miracles Gala • June 5, 2025'
+    """
+    layer = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(layer)
+
+    band_height = max(40, int(height * BAND_FRACTION))
+    top = height - band_height
+    draw.rectangle((0, top, width, height), fill=brand_assets.NAVY + (200,))
+    draw.line((0, top, width, top), fill=brand_assets.GOLD + (255,), width=3)
+
+    # Logo on the right, caption centered in the remaining space
+    padding = band_height // 6
+    logo = brand_assets.load_logo(band_height - 2 * padding)
+    layer.alpha_composite(logo, (width - logo.width - padding, top + padding))
+
+    font = brand_assets.load_font(int(band_height * 0.42), "bold")
+    text_center = (width - logo.width - padding) / 2
+    draw.text((text_center, top + band_height / 2), caption, font=font, fill=brand_assets.WHITE + (255,), anchor="mm")
+    return layer
+
+
+def make_variant(image, variant):
+    """
+    Resize/crop/pad an RGB portrait into one share variant
+
+    Parameters:
+    - image: RGB PIL Image (the generated 1024x1536 figure)
+    - variant: key of VARIANTS
+
+    Returns:
+    - RGB PIL Image at the variant's size
+    """
+    width, height, _ = VARIANTS[variant]
+
+    if variant == "square":
+        # Full-width square crop, biased toward the face and title
+        side = min(image.size)
+        top = int((image.height - side) * SQUARE_CROP_BIAS)
+        cropped = image.crop((0, top, side, top + side))
+        return cropped.resize((width, height), Image.LANCZOS)
+
+    if variant == "story":
+        # Fit the whole package and fill the rest with the brand purple
+        scale = min(width / image.width, height / image.height)
+        fitted = image.resize((round(image.width * scale), round(image.height * scale)), Image.LANCZOS)
+        canvas = Image.new("RGB", (width, height), brand_assets.PURPLE)
+        canvas.paste(fitted, ((width - fitted.width) // 2, (height - fitted.height) // 2))
+        return canvas
+
+    if image.size == (width, height):
+        return image
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def stamp(image, caption):
+    """Composite the cached caption/logo overlay onto an RGB image"""
+    stamped = image.convert("RGBA")
+    stamped.alpha_composite(overlay_layer(image.width, image.height, caption))
+    return stamped.convert("RGB")
+
+
+def encode(image, fmt):
+    """Encode an RGB image in one of FORMATS"""
+    save_kwargs = FORMATS[fmt][0]
+    buffered = BytesIO()
+    image.save(buffered, **save_kwargs)
+    return buffered.getvalue()
+
+
+def process_result(image_bytes, caption):
+    """
+    Build every stamped variant and encoding for one generated figure
+
+    Parameters:
+    - image_bytes: Raw bytes of the generated image
+    - caption: Event name/date text for the overlay band
+
+    Returns:
+    - dict of variant -> format -> bytes
+    """
+    start = time.perf_counter()
+    image = Image.open(BytesIO(image_bytes)).convert("RGB")
+
+    results = {}
+    for variant in VARIANTS:
+        stamped = stamp(make_variant(image, variant), caption)
+        results[variant] = {fmt: encode(stamped, fmt) for fmt in FORMATS}
+
+    metrics.record_timing("postprocess", time.perf_counter() - start)
+    return results
+
+
+def submit(image_bytes, caption):
+    """Post-process a result in the worker pool and return its Future"""
+    return _executor.submit(process_result, image_bytes, caption)
+
+
+def event_caption(event_name, event_date):
+    """Caption text for the overlay band, e.g. 'Expect Miracles Gala • June 5, 2025'"""
+    if event_date:
+        return f"{event_name} • {event_date}"
+    return event_name
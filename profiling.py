@@ -0,0 +1,268 @@
+"""
+Opt-in Profiling for Expect Miracles App
+========================================
+Samples a fraction of sessions and records cProfile and tracemalloc data
+for their reruns and generation calls, so a slow host mid-event can be
+traced back to the heavy step. Each profiled scope writes a .prof file
+(pstats) plus a .json summary into a rotating directory; the report
+command aggregates them.
+
+Off by default: an unprofiled scope costs one attribute check.
+
+Settings (environment):
+    PROFILE_SAMPLE_RATE  Fraction of sessions profiled, 0-1 (default 0 = off)
+    PROFILE_DIR          Where profiles are written (default profiles/)
+    PROFILE_MAX_FILES    Profiles kept before the oldest are deleted (default 200)
+
+Usage:
+    PROFILE_SAMPLE_RATE=0.1 streamlit run app.py
+
+    python profiling.py report
+    python profiling.py report --top 30 --dir profiles
+"""
+
+import argparse
+import cProfile
+import glob
+import itertools
+import json
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+
+import metrics
+
+DEFAULT_DIR = "profiles"
+DEFAULT_MAX_FILES = 200
+
+# Allocation sites kept per profile (the report merges them across profiles)
+ALLOCATION_SITES = 25
+
+_lock = threading.Lock()
+_tracing_scopes = 0
+_owns_tracing = False
+_sequence = itertools.count()
+
+# Scopes already profiling on this thread (nested scopes fold into the outer one)
+_active = threading.local()
+
+
+def sample_rate():
+    """Fraction of sessions to profile (PROFILE_SAMPLE_RATE, clamped to 0-1)"""
+    try:
+        rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    except ValueError:
+        return 0.0
+    return max(0.0, min(rate, 1.0))
+
+
+def sample_session():
+    """Decide once per session whether it is profiled"""
+    rate = sample_rate()
+    return rate > 0 and random.random() < rate
+
+
+def profile_dir():
+    return os.getenv("PROFILE_DIR", DEFAULT_DIR)
+
+
+def _start_tracing():
+    """Start tracemalloc for the first active scope (it is process-wide)"""
+    global _tracing_scopes, _owns_tracing
+    with _lock:
+        if _tracing_scopes == 0:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _owns_tracing = True
+            tracemalloc.reset_peak()
+        _tracing_scopes += 1
+
+
+def _stop_tracing():
+    global _tracing_scopes, _owns_tracing
+    with _lock:
+        _tracing_scopes -= 1
+        if _tracing_scopes == 0 and _owns_tracing:
+            tracemalloc.stop()
+            _owns_tracing = False
+
+
+def _allocation_sites(before, after):
+    """Largest allocation growth between two snapshots, by file:line"""
+    sites = []
+    for stat in after.compare_to(before, "lineno")[:ALLOCATION_SITES]:
+        if stat.size_diff <= 0:
+            continue
+        frame = stat.traceback[0]
+        sites.append({"site": f"{frame.filename}:{frame.lineno}", "size_kb": stat.size_diff / 1024, "count": stat.count_diff})
+    return sites
+
+
+def _rotate(directory, max_files):
+    """Delete the oldest profiles beyond max_files"""
+    summaries = sorted(glob.glob(os.path.join(directory, "*.json")), key=os.path.getmtime)
+    for path in summaries[:max(0, len(summaries) - max_files)]:
+        for stale in (path, path[:-len(".json")] + ".prof"):
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+
+def _write(label, profiler, summary):
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{os.getpid()}-{next(_sequence)}")
+    if profiler is not None:
+        profiler.dump_stats(stem + ".prof")
+    with open(stem + ".json", "w") as f:
+        json.dump(summary, f)
+    _rotate(directory, int(os.getenv("PROFILE_MAX_FILES", DEFAULT_MAX_FILES)))
+
+
+@contextmanager
+def profile(label, enabled=True, **details):
+    """
+    Profile a block with cProfile and tracemalloc and write the result
+
+    Parameters:
+    - label: Scope name used in the report (e.g. 'rerun', 'generation')
+    - enabled: False makes this a no-op (the usual case)
+    - details: Extra fields for the summary, e.g. step=3
+
+    Allocation sites and peak memory include other threads' allocations
+    made meanwhile. A scope inside another on the same thread is folded
+    into the outer one.
+    """
+    if not enabled or getattr(_active, "profiling", False):
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is active on this thread - keep the timings only
+        profiler = None
+
+    _active.profiling = True
+    _start_tracing()
+    before = tracemalloc.take_snapshot()
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield
+    finally:
+        cpu = time.thread_time() - cpu_start
+        wall = time.perf_counter() - wall_start
+        if profiler is not None:
+            profiler.disable()
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        _stop_tracing()
+        _active.profiling = False
+
+        summary = dict(details, label=label, started_at=time.time() - wall, wall=wall, cpu=cpu,
+                       peak_kb=peak / 1024, allocations=_allocation_sites(before, after))
+        try:
+            _write(label, profiler, summary)
+            metrics.increment(f"profiles_written.{label}")
+        except OSError:
+            metrics.increment("profiles_failed")
+
+
+def profiled(func, label, **details):
+    """Wrap a callable so each call runs inside profile(label) - e.g. a generation call on a worker thread"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with profile(label, **details):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+# ============================================================================
+# REPORT
+# ============================================================================
+def load_summaries(directory):
+    """(summary dict, path of its .prof or None) for every profile in a directory"""
+    profiles = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        try:
+            with open(path) as f:
+                summary = json.load(f)
+        except (OSError, ValueError):
+            continue
+        prof_path = path[:-len(".json")] + ".prof"
+        profiles.append((summary, prof_path if os.path.exists(prof_path) else None))
+    return profiles
+
+
+def scope_name(summary):
+    """Label plus step/mode, e.g. 'rerun step 3' or 'generation'"""
+    parts = [summary["label"]] + [f"{key} {summary[key]}" for key in ("mode", "step") if summary.get(key)]
+    return " ".join(str(part) for part in parts)
+
+
+def print_report(directory, top):
+    profiles = load_summaries(directory)
+    if not profiles:
+        print(f"No profiles found in {directory}/")
+        return
+
+    print("\n" + "="*60)
+    print(f"🔬 Profiling Report: {len(profiles)} profiles from {directory}/")
+    print("="*60)
+
+    # Per-step cost
+    by_scope = {}
+    for summary, _ in profiles:
+        by_scope.setdefault(scope_name(summary), []).append(summary)
+    print(f"\n{'Scope':<24}{'Runs':>6}{'Wall p50':>10}{'Wall p95':>10}{'CPU p50':>10}{'CPU p95':>10}{'Peak MB':>9}")
+    for scope, summaries in sorted(by_scope.items(), key=lambda item: -sum(s["cpu"] for s in item[1])):
+        wall = metrics.summarize([s["wall"] for s in summaries])
+        cpu = metrics.summarize([s["cpu"] for s in summaries])
+        peak = max(s["peak_kb"] for s in summaries) / 1024
+        print(f"{scope:<24}{wall['count']:>6}{wall['p50'] * 1000:>8.0f}ms{wall['p95'] * 1000:>8.0f}ms"
+              f"{cpu['p50'] * 1000:>8.0f}ms{cpu['p95'] * 1000:>8.0f}ms{peak:>9.1f}")
+
+    # Allocation sites merged across profiles
+    sites = {}
+    for summary, _ in profiles:
+        for site in summary.get("allocations", []):
+            totals = sites.setdefault(site["site"], [0.0, 0])
+            totals[0] += site["size_kb"]
+            totals[1] += site["count"]
+    print(f"\n💾 Top {top} allocation sites (growth summed over profiles)")
+    for site, (size_kb, count) in sorted(sites.items(), key=lambda item: -item[1][0])[:top]:
+        print(f"{size_kb / 1024:>9.1f} MB {count:>9} blocks  {site}")
+
+    # Hot functions from the merged cProfile data
+    prof_paths = [path for _, path in profiles if path]
+    if prof_paths:
+        print(f"\n🔥 Top {top} functions by own time")
+        print(f"{'Own (s)':>9}{'Total (s)':>11}{'Calls':>10}  Function")
+        stats = pstats.Stats(*prof_paths).stats
+        for (filename, line, name), (_, calls, own, total, _) in sorted(stats.items(), key=lambda item: -item[1][2])[:top]:
+            function = f"{name} ({os.path.basename(filename)}:{line})" if line else name
+            print(f"{own:>9.3f}{total:>11.3f}{calls:>10}  {function}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate profiles written by sampled sessions")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report = subparsers.add_parser("report", help="Hot functions, allocation sites and per-step cost")
+    report.add_argument("--dir", default=profile_dir(), help="Profile directory (default PROFILE_DIR or profiles/)")
+    report.add_argument("--top", type=int, default=20, help="Rows per section")
+    args = parser.parse_args()
+
+    if args.command == "report":
+        print_report(args.dir, args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Readiness Self-Test for Expect Miracles App
+===========================================
+Warms everything the first attendees after doors open would otherwise pay
+for - image decoders (including the HEIF plugin), brand fonts and logos,
+the instant-figure template, packaging text and share overlay layers, the
+TLS connection to the images API - then runs one synthetic generation end
+to end and reports how long each step took.
+
+Run it before the QR codes go up. The command checks the configuration
+from a separate process; opening the deployed app at ?health=1 runs the
+same checks inside the server process, so its caches and connection pool
+are the ones that get warm.
+
+Usage:
+    python readiness.py                      # configured backend (one paid image call)
+    python readiness.py --skip-generation    # warm-up and API key check only
+    IMAGE_BACKEND=fake python readiness.py
+"""
+
+import argparse
+import os
+import sys
+import time
+from functools import partial
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+import brand_assets
+import generation
+import instant_figure
+import metrics
+import packaging_text
+import postprocess
+import upload_prep
+
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIC_SUPPORTED = True
+except ImportError:
+    HEIC_SUPPORTED = False
+
+# Name and caption used for the synthetic figure
+TEST_NAME = "Readiness Check"
+
+# Longest a synthetic generation may take before it counts as failed (seconds)
+GENERATION_TIMEOUT = 180
+
+# Size of the synthetic phone photo (portrait, like an upload)
+PHOTO_SIZE = (1536, 2048)
+
+
+def synthetic_photo():
+    """JPEG bytes of a plain portrait 'photo': a grey figure on a light wall"""
+    width, height = PHOTO_SIZE
+    photo = Image.new("RGB", PHOTO_SIZE, (226, 222, 214))
+    draw = ImageDraw.Draw(photo)
+    draw.ellipse((width * 0.38, height * 0.12, width * 0.62, height * 0.32), fill=(196, 160, 136))
+    draw.rounded_rectangle((width * 0.28, height * 0.33, width * 0.72, height * 0.95), radius=width // 12, fill=(52, 64, 92))
+
+    buffered = BytesIO()
+    photo.save(buffered, format="JPEG", quality=90)
+    return buffered.getvalue()
+
+
+def warm_decoders():
+    """Round-trip a tiny image through every upload format so plugins are initialized"""
+    formats = ["JPEG", "PNG"] + (["HEIF"] if HEIC_SUPPORTED else [])
+    tiny = Image.new("RGB", (64, 64), brand_assets.PURPLE)
+    for fmt in formats:
+        buffered = BytesIO()
+        tiny.save(buffered, format=fmt)
+        Image.open(BytesIO(buffered.getvalue())).load()
+    return ", ".join(formats)
+
+
+def warm_overlays(caption):
+    """Build the cached share-variant overlay layers for the event caption"""
+    for width, height, _ in postprocess.VARIANTS.values():
+        postprocess.overlay_layer(width, height, caption)
+    return f"{len(postprocess.VARIANTS)} share formats"
+
+
+def check_connection(client, engine=None):
+    """One cheap authenticated request - opens the pooled connection and proves the API key works"""
+    if client is None:
+        raise RuntimeError("OpenAI API key not configured")
+    client.models.retrieve(generation.MODEL)
+    if engine is not None:
+        # The asyncio engine generates over its own connection pool
+        engine.warm_up().result(timeout=GENERATION_TIMEOUT)
+        return f"{generation.MODEL} reachable (sync and async clients)"
+    return f"{generation.MODEL} reachable"
+
+
+def run_generation(generate, png_bytes, prompt):
+    """
+    Run a generation callable, waiting on its Future when it returns one (asyncio engine)
+
+    Returns:
+    - dict with the image_url of the synthetic figure
+    """
+    image_url = generate(png_bytes, prompt)
+    if hasattr(image_url, "result"):
+        image_url = image_url.result(timeout=GENERATION_TIMEOUT)
+    return {"image_url": image_url}
+
+
+def finish_result(image_url, caption, local_title):
+    """Download/decode the synthetic figure and build its share formats like step 4 does"""
+    image_bytes = generation.fetch_image_bytes(image_url)
+    if local_title:
+        image_bytes = packaging_text.titled_png(image_bytes, TEST_NAME)
+    results = postprocess.process_result(image_bytes, caption)
+    return f"{len(image_bytes) / 1024:.0f} KB figure, {sum(len(formats) for formats in results.values())} share files"
+
+
+def _run(checks, name, func, *args):
+    """Time one check and append its result; returns the check's value (None if it failed)"""
+    start = time.perf_counter()
+    try:
+        value = func(*args)
+        status, detail = "ok", value if isinstance(value, str) else ""
+    except Exception as e:
+        value = None
+        status, detail = "failed", f"{type(e).__name__}: {e}"
+    checks.append({"check": name, "status": status, "seconds": time.perf_counter() - start, "detail": detail})
+    return value
+
+
+def _skip(checks, name, reason):
+    checks.append({"check": name, "status": "skipped", "seconds": 0.0, "detail": reason})
+
+
+def run_checks(client, generate=None, caption=TEST_NAME, local_title=False, skip_generation=False, engine=None):
+    """
+    Warm caches and run the synthetic end-to-end generation
+
+    Parameters:
+    - client: OpenAI client (or fake_backend.FakeOpenAIClient), None if not configured
+    - generate: Callable(png_bytes, prompt) returning an image URL or a
+      Future of one; defaults to generation.call_images_edit on client
+    - caption: Event caption whose overlay layers are pre-built
+    - local_title: Generate with a blank header and draw the title locally
+    - skip_generation: Warm up and check the API key without a paid image call
+    - engine: async_engine.AsyncGenerationEngine when generation runs on it,
+      so its connection is warmed too
+
+    Returns:
+    - list of dicts with check, status ('ok', 'failed', 'skipped'), seconds and detail
+    """
+    start = time.perf_counter()
+    checks = []
+
+    # Local warm-up - no network
+    _run(checks, "Image decoders", warm_decoders)
+    _run(checks, "Brand fonts & logo", brand_assets.preload)
+    _run(checks, "Instant figure template", instant_figure.preload)
+    _run(checks, "Packaging text layers", packaging_text.preload)
+    _run(checks, "Share overlays", warm_overlays, caption)
+
+    # API connection and key
+    connected = _run(checks, "API connection", check_connection, client, engine) is not None
+
+    # Synthetic attendee, end to end
+    prepared = _run(checks, "Upload preparation", upload_prep.prepare_upload, synthetic_photo())
+    if skip_generation or not connected or prepared is None:
+        reason = "--skip-generation" if skip_generation else "previous check failed"
+        _skip(checks, "Generation", reason)
+        _skip(checks, "Result & share formats", reason)
+    else:
+        generate = generate or partial(generation.call_images_edit, client)
+        prompt = generation.build_prompt(TEST_NAME, "", blank_title=local_title)
+        generated = _run(checks, "Generation", run_generation, generate, prepared["png_bytes"], prompt)
+        if generated is None:
+            _skip(checks, "Result & share formats", "generation failed")
+        else:
+            _run(checks, "Result & share formats", finish_result, generated["image_url"], caption, local_title)
+
+    metrics.record_timing("readiness", time.perf_counter() - start)
+    if not is_ready(checks):
+        metrics.increment("readiness_failed")
+    return checks
+
+
+def is_ready(checks):
+    """True when no check failed (skipped checks don't count against readiness)"""
+    return all(check["status"] != "failed" for check in checks)
+
+
+# ============================================================================
+# COMMAND LINE
+# ============================================================================
+def load_api_key(secrets_path=os.path.join(".streamlit", "secrets.toml")):
+    """OPENAI_API_KEY, or [openai] api_key from the app's secrets.toml"""
+    api_key = os.getenv("OPENAI_API_KEY")
+    if api_key:
+        return api_key
+    try:
+        import tomllib
+        with open(secrets_path, "rb") as f:
+            return tomllib.load(f).get("openai", {}).get("api_key")
+    except (ImportError, OSError, ValueError):
+        # tomllib needs Python 3.11 - older versions use the environment only
+        return None
+
+
+def create_client():
+    """Client for the configured backend, mirroring the app (IMAGE_BACKEND=fake or OpenAI)"""
+    if os.getenv("IMAGE_BACKEND") == "fake":
+        from fake_backend import FakeOpenAIClient
+        return FakeOpenAIClient(latency=float(os.getenv("FAKE_BACKEND_LATENCY", "5")))
+
+    api_key = load_api_key()
+    if not api_key:
+        return None
+    from openai import OpenAI
+    return OpenAI(api_key=api_key)
+
+
+def print_report(checks):
+    icons = {"ok": "✅", "failed": "❌", "skipped": "⏭️"}
+    print("\n" + "="*60)
+    print("🩺 Readiness Self-Test")
+    print("="*60)
+    for check in checks:
+        print(f"{icons[check['status']]} {check['check']:<26}{check['seconds'] * 1000:>9.0f} ms  {check['detail']}")
+    total = sum(check["seconds"] for check in checks)
+    print(f"\n{'✅ Ready' if is_ready(checks) else '❌ NOT ready'} - {total:.1f}s total")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm caches and run a synthetic generation before the event")
+    parser.add_argument("--skip-generation", action="store_true", help="Check the API key without a paid image call")
+    parser.add_argument("--local-titles", action="store_true", help="Generate with a blank header and draw the title locally")
+    parser.add_argument("--caption", default=TEST_NAME, help="Event caption whose overlays are pre-built")
+    args = parser.parse_args()
+
+    checks = run_checks(create_client(), caption=args.caption, local_title=args.local_titles,
+                        skip_generation=args.skip_generation)
+    print_report(checks)
+    sys.exit(0 if is_ready(checks) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+"""
+Generation Scheduler with Priority Lanes
+========================================
+Limits how many images.edit() calls run at once and decides who goes next.
+
+Each request joins a lane (VIP, staff, retry, kiosk, standard). Lanes are
+served by stride scheduling: a lane with weight 8 gets roughly eight turns
+for every turn of a weight-1 lane, yet no lane ever starves. Admission
+control estimates the wait for a new request and, instead of letting the
+queue grow without limit, hands out a reservation to come back later.
+
+Usage:
+    scheduler = GenerationScheduler(max_concurrent=8)
+    job = scheduler.submit("standard", generation.call_images_edit, client, png, prompt)
+    image_url = job.future.result()
+"""
+
+import math
+import secrets
+import threading
+import time
+from collections import deque
+from concurrent.futures import CancelledError, Future
+
+import metrics
+
+# Lane name -> weight, display label, whether admission control applies
+LANES = {
+    "vip": {"weight": 8, "label": "VIP", "admission": False},
+    "staff": {"weight": 6, "label": "Staff", "admission": False},
+    "retry": {"weight": 6, "label": "Retry", "admission": False},
+    "kiosk": {"weight": 3, "label": "Kiosk", "admission": True},
+    "standard": {"weight": 1, "label": "Standard", "admission": True},
+}
+
+DEFAULT_LANE = "standard"
+
+# Seed for the average generation time until real samples arrive (seconds)
+INITIAL_SERVICE_SECONDS = 75.0
+
+# Reservations may be redeemed from ready_at until this long afterwards
+RESERVATION_WINDOW_SECONDS = 15 * 60
+
+# Characters for reservation codes (no 0/O or 1/I confusion)
+CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+
+
+class AdmissionRejected(Exception):
+    """Raised by submit() when the estimated wait is over the limit"""
+
+    def __init__(self, reservation):
+        self.reservation = reservation
+        super().__init__(
+            f"Queue is full - come back in {reservation['minutes']} minutes "
+            f"with reservation {reservation['code']}"
+        )
+
+
+class ReservationNotDue(AdmissionRejected):
+    """Raised by submit() for a valid reservation presented before its ready time"""
+
+    def __init__(self, reservation):
+        self.reservation = reservation
+        Exception.__init__(
+            self,
+            f"Reservation {reservation['code']} is not due until "
+            f"{time.strftime('%H:%M', time.localtime(reservation['ready_at']))}"
+        )
+
+
+class GenerationJob:
+    """One queued call plus its Future and timing"""
+
+    def __init__(self, lane, fn, args, kwargs):
+        self.lane = lane
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+
+
+class GenerationScheduler:
+    """
+    Weighted priority queue in front of a fixed pool of worker threads
+
+    Jobs normally block a worker thread for their whole duration. A job whose
+    callable returns a concurrent.futures.Future (e.g. AsyncGenerationEngine.submit)
+    only occupies a concurrency slot, so a single worker thread can dispatch
+    many in-flight calls.
+
+    Parameters:
+    - max_concurrent: Number of generation calls allowed in flight
+    - max_wait_seconds: Estimated wait above which new requests get a reservation
+    - lanes: Lane configuration (defaults to LANES)
+    - worker_threads: Dispatcher threads (defaults to max_concurrent; 1 is
+      enough when jobs return Futures)
+    """
+
+    def __init__(self, max_concurrent=8, max_wait_seconds=600, lanes=None, worker_threads=None):
+        self.max_concurrent = max_concurrent
+        self.max_wait_seconds = max_wait_seconds
+        self.lanes = lanes or LANES
+        self.worker_threads = worker_threads or max_concurrent
+
+        self._cond = threading.Condition()
+        self._queues = {lane: deque() for lane in self.lanes}
+        self._pass = {lane: 0.0 for lane in self.lanes}
+        self._virtual_time = 0.0
+        self._in_flight = 0
+        self._avg_service = INITIAL_SERVICE_SECONDS
+        self._reservations = {}
+        self._workers = []
+
+    # ------------------------------------------------------------------
+    # Submission and admission control
+    # ------------------------------------------------------------------
+    def submit(self, lane, fn, *args, reservation_code=None, **kwargs):
+        """
+        Queue fn(*args, **kwargs) in a lane
+
+        Parameters:
+        - lane: Lane name (unknown lanes fall back to DEFAULT_LANE)
+        - fn: Callable to run on a worker thread (may return a Future)
+        - reservation_code: Code from an earlier AdmissionRejected (skips admission)
+
+        Returns:
+        - GenerationJob whose .future resolves to fn's return value
+
+        Raises:
+        - ReservationNotDue when the reservation is valid but early (it is kept)
+        - AdmissionRejected when the lane is over its wait limit
+        """
+        if lane not in self.lanes:
+            lane = DEFAULT_LANE
+
+        with self._cond:
+            reserved = reservation_code is not None and self._redeem(reservation_code, lane)
+            if self.lanes[lane]["admission"] and not reserved:
+                estimate = self._estimate_wait_locked(lane)
+                if estimate > self.max_wait_seconds:
+                    metrics.increment(f"lane_rejected.{lane}")
+                    raise AdmissionRejected(self._reserve_locked(lane, estimate))
+
+            job = GenerationJob(lane, fn, args, kwargs)
+            queue = self._queues[lane]
+            if not queue:
+                # A lane waking up from idle must not cash in credit from the past
+                self._pass[lane] = max(self._pass[lane], self._virtual_time)
+            queue.append(job)
+            metrics.increment(f"lane_admitted.{lane}")
+            self._ensure_workers_locked()
+            self._cond.notify()
+        return job
+
+    def estimate_wait(self, lane):
+        """Estimated seconds before a new request in this lane would start"""
+        with self._cond:
+            return self._estimate_wait_locked(lane if lane in self.lanes else DEFAULT_LANE)
+
+    def position(self, job):
+        """Number of queued jobs served before this one (0 once it has started)"""
+        with self._cond:
+            if job.started_at is not None:
+                return 0
+            return self._jobs_ahead_locked(job.lane, self._queues[job.lane].index(job) + 1)
+
+    def _jobs_ahead_locked(self, lane, depth):
+        """Jobs from all lanes served before the depth-th job of a lane"""
+        weight = self.lanes[lane]["weight"]
+        ahead = depth - 1
+        for other, queue in self._queues.items():
+            if other == lane:
+                continue
+            # Stride scheduling serves other lanes in proportion to their weight
+            share = depth * self.lanes[other]["weight"] / weight
+            ahead += min(len(queue), int(math.ceil(share)))
+        return ahead
+
+    def _estimate_wait_locked(self, lane):
+        ahead = self._jobs_ahead_locked(lane, len(self._queues[lane]) + 1)
+        free_slots = self.max_concurrent - self._in_flight
+        if ahead < free_slots:
+            return 0.0
+        # Each "round" of max_concurrent jobs takes about one average generation
+        rounds = (ahead - free_slots) // self.max_concurrent + 1
+        return rounds * self._avg_service
+
+    # ------------------------------------------------------------------
+    # Reservations
+    # ------------------------------------------------------------------
+    def _reserve_locked(self, lane, estimate):
+        code = "".join(secrets.choice(CODE_ALPHABET) for _ in range(6))
+        now = time.time()
+        reservation = {
+            "code": code,
+            "lane": lane,
+            "minutes": max(1, int(math.ceil(estimate / 60))),
+            "ready_at": now + estimate,
+            "expires_at": now + estimate + RESERVATION_WINDOW_SECONDS,
+        }
+        self._reservations[code] = reservation
+        self._expire_reservations_locked(now)
+        return reservation
+
+    def _redeem(self, code, lane):
+        """
+        Consume a reservation for a lane
+
+        Returns:
+        - True if it was valid and due; False if unknown, expired or for another lane
+
+        Raises:
+        - ReservationNotDue if it is valid but early - it keeps its place
+          instead of being replaced by a new, later reservation
+        """
+        reservation = self._reservations.get(code.strip().upper())
+        now = time.time()
+        if reservation is None or reservation["lane"] != lane or now > reservation["expires_at"]:
+            return False
+        if now < reservation["ready_at"]:
+            metrics.increment("reservations_early")
+            remaining = dict(reservation, minutes=max(1, int(math.ceil((reservation["ready_at"] - now) / 60))))
+            raise ReservationNotDue(remaining)
+        del self._reservations[reservation["code"]]
+        metrics.increment("reservations_redeemed")
+        return True
+
+    def _expire_reservations_locked(self, now):
+        expired = [code for code, r in self._reservations.items() if now > r["expires_at"]]
+        for code in expired:
+            del self._reservations[code]
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+    def _ensure_workers_locked(self):
+        while len(self._workers) < self.worker_threads:
+            worker = threading.Thread(
+                target=self._worker_loop,
+                name=f"generation-{len(self._workers)}",
+                daemon=True
+            )
+            self._workers.append(worker)
+            worker.start()
+
+    def _next_job_locked(self):
+        """Pick the non-empty lane with the lowest pass value (stride scheduling)"""
+        if self._in_flight >= self.max_concurrent:
+            return None
+        ready = [lane for lane, queue in self._queues.items() if queue]
+        if not ready:
+            return None
+        lane = min(ready, key=lambda name: (self._pass[name], -self.lanes[name]["weight"]))
+        self._virtual_time = self._pass[lane]
+        self._pass[lane] += 1.0 / self.lanes[lane]["weight"]
+        return self._queues[lane].popleft()
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                job = self._next_job_locked()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job_locked()
+                self._in_flight += 1
+                job.started_at = time.monotonic()
+
+            if not job.future.set_running_or_notify_cancel():
+                # Cancelled while queued - no wait sample, no service time
+                self._finish(job, succeeded=False)
+                continue
+
+            metrics.record_timing(f"lane_wait.{job.lane}", job.started_at - job.enqueued_at)
+
+            try:
+                result = job.fn(*job.args, **job.kwargs)
+            except BaseException as e:
+                job.future.set_exception(e)
+                self._finish(job, succeeded=False)
+                continue
+
+            if isinstance(result, Future):
+                # Non-blocking job - keep the slot until the inner Future resolves
+                result.add_done_callback(lambda inner, job=job: self._finish_async(job, inner))
+            else:
+                job.future.set_result(result)
+                self._finish(job, succeeded=True)
+
+    def _finish_async(self, job, inner):
+        """Copy an inner Future's outcome to the job and release its slot"""
+        error = CancelledError() if inner.cancelled() else inner.exception()
+        if error is not None:
+            job.future.set_exception(error)
+        else:
+            job.future.set_result(inner.result())
+        self._finish(job, succeeded=error is None)
+
+    def _finish(self, job, succeeded):
+        """Release a concurrency slot; successful jobs update the service-time estimate"""
+        duration = time.monotonic() - job.started_at
+        with self._cond:
+            self._in_flight -= 1
+            if succeeded:
+                # Exponential moving average keeps the estimate current - failed
+                # and cancelled jobs end almost instantly and would drag it down
+                self._avg_service = 0.8 * self._avg_service + 0.2 * duration
+            self._cond.notify()
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+    def stats(self):
+        """
+        Per-lane queue depth and wait statistics
+
+        Returns:
+        - dict with 'in_flight', 'avg_service_seconds' and 'lanes'
+          (lane -> queued, estimated_wait, wait summary, admitted, rejected)
+        """
+        snapshot = metrics.snapshot()
+        with self._cond:
+            lanes = {}
+            for lane in self.lanes:
+                lanes[lane] = {
+                    "queued": len(self._queues[lane]),
+                    "estimated_wait": self._estimate_wait_locked(lane),
+                    "wait": snapshot["timings"].get(f"lane_wait.{lane}", metrics.summarize([])),
+                    "admitted": snapshot["counters"].get(f"lane_admitted.{lane}", 0),
+                    "rejected": snapshot["counters"].get(f"lane_rejected.{lane}", 0),
+                }
+            return {
+                "in_flight": self._in_flight,
+                "avg_service_seconds": self._avg_service,
+                "reservations_outstanding": len(self._reservations),
+                "lanes": lanes,
+            }
+
+
+def resolve_lane(requested_lane, token, lane_tokens):
+    """
+    Decide which lane a session belongs to
+
+    Parameters:
+    - requested_lane: Lane named in the URL (?lane=vip), may be None
+    - token: Token from the URL (?token=...), may be None
+    - lane_tokens: dict of lane -> secret token from configuration
+
+    Returns:
+    - lane name; anything other than 'standard' requires a matching token
+    """
+    if not token:
+        return DEFAULT_LANE
+
+    if requested_lane and lane_tokens.get(requested_lane):
+        if secrets.compare_digest(str(lane_tokens[requested_lane]), token):
+            return requested_lane
+        return DEFAULT_LANE
+
+    # A token alone is enough - look up which lane it belongs to
+    for lane, lane_token in lane_tokens.items():
+        if lane in LANES and lane_token and secrets.compare_digest(str(lane_token), token):
+            return lane
+    return DEFAULT_LANE
@@ -0,0 +1,186 @@
+"""
+Upload Preparation for Expect Miracles App
+==========================================
+Everything the generation call needs from the attendee's photo that does NOT
+depend on their name: orientation fix, resize, RGB conversion, validation,
+PNG encoding and hashing. Runs in a background executor as soon as step 1
+receives the file, so step 3 submits a ready-made payload.
+
+The connection warm-up also lives here: it opens the TLS connection to the
+images API while the attendee is still typing their name.
+"""
+
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+import metrics
+
+# Longest side sent to the API - output is 1024x1536 so larger inputs only
+# cost upload time
+MAX_UPLOAD_SIDE = 1536
+
+# Smallest photo that still gives a recognizable likeness
+MIN_UPLOAD_SIDE = 256
+
+# Longest side of the on-screen preview shown in steps 1 and 2
+PREVIEW_SIDE = 800
+
+# Re-warm the API connection at most this often (seconds)
+WARMUP_INTERVAL = 30
+
+# Longest the background warm-up waits on the asyncio engine's request (seconds)
+WARMUP_TIMEOUT = 30
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="upload-prep")
+
+_warmup_lock = threading.Lock()
+_last_warmup = 0.0
+
+
+def prepare_image(image):
+    """
+    Prepare a decoded PIL Image for the images.edit() call
+
+    Parameters:
+    - image: PIL Image object (any mode, may carry EXIF orientation)
+
+    Returns:
+    - dict with 'image' (RGB PIL Image), 'png_bytes', 'preview_bytes',
+      'sha256', 'size' and 'prep_seconds'
+
+    Raises:
+    - ValueError if the photo is too small to use
+    """
+    start = time.perf_counter()
+
+    # Apply EXIF orientation so phone photos are not sideways
+    image = ImageOps.exif_transpose(image)
+
+    if min(image.size) < MIN_UPLOAD_SIDE:
+        raise ValueError(
+            f"Photo is too small ({image.size[0]}x{image.size[1]}). "
+            f"Please use a photo at least {MIN_UPLOAD_SIDE} pixels wide and tall."
+        )
+
+    # Convert to RGB (removes alpha channel, handles CMYK/palette/HEIC modes)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    # Downscale large phone photos - the API output is only 1024x1536
+    if max(image.size) > MAX_UPLOAD_SIDE:
+        image = image.copy()
+        image.thumbnail((MAX_UPLOAD_SIDE, MAX_UPLOAD_SIDE), Image.LANCZOS)
+
+    # Encode the API payload
+    png_buffer = BytesIO()
+    image.save(png_buffer, format='PNG')
+    png_bytes = png_buffer.getvalue()
+
+    # Encode a small JPEG preview once so reruns don't re-encode the photo
+    preview = image.copy()
+    preview.thumbnail((PREVIEW_SIDE, PREVIEW_SIDE), Image.LANCZOS)
+    preview_buffer = BytesIO()
+    preview.save(preview_buffer, format='JPEG', quality=85)
+
+    prep_seconds = time.perf_counter() - start
+    metrics.record_timing("upload_prep", prep_seconds)
+
+    return {
+        "image": image,
+        "png_bytes": png_bytes,
+        "preview_bytes": preview_buffer.getvalue(),
+        "sha256": hashlib.sha256(png_bytes).hexdigest(),
+        "size": image.size,
+        "prep_seconds": prep_seconds,
+    }
+
+
+def decode_upload(raw_bytes):
+    """Decode uploaded file bytes (JPG, PNG or HEIC) into a loaded PIL Image"""
+    image = Image.open(BytesIO(raw_bytes))
+
+    # Let the JPEG decoder downscale while decoding (much faster for 12MP+)
+    if image.format == 'JPEG':
+        image.draft('RGB', (MAX_UPLOAD_SIDE, MAX_UPLOAD_SIDE))
+
+    image.load()
+    return image
+
+
+def prepare_upload(raw_bytes):
+    """
+    Decode uploaded file bytes and prepare them for the API
+
+    Parameters:
+    - raw_bytes: contents of the uploaded file (JPG, PNG or HEIC)
+
+    Returns:
+    - dict from prepare_image()
+    """
+    start = time.perf_counter()
+    prepared = prepare_image(decode_upload(raw_bytes))
+    prepared["prep_seconds"] = time.perf_counter() - start
+    return prepared
+
+
+def submit_prepare(raw_bytes):
+    """Start preparing an upload in the background and return its Future"""
+    return _executor.submit(prepare_upload, raw_bytes)
+
+
+def wait_for_prepared(future):
+    """
+    Collect a prefetched upload at generation time and record the savings
+
+    The same upload is collected again by retries and "Try Again", so the
+    savings are recorded only the first time.
+
+    Parameters:
+    - future: Future returned by submit_prepare()
+
+    Returns:
+    - dict from prepare_image()
+    """
+    start = time.perf_counter()
+    prepared = future.result()
+    waited = time.perf_counter() - start
+
+    if not prepared.get("collected"):
+        prepared["collected"] = True
+        # Anything not spent waiting here was taken off the critical path
+        metrics.record_timing("upload_prep_wait", waited)
+        metrics.record_timing("upload_prep_saved", max(0.0, prepared["prep_seconds"] - waited))
+    return prepared
+
+
+def _warm_up(client, engine):
+    """Make one cheap authenticated request to open the pooled connection"""
+    start = time.perf_counter()
+    try:
+        client.models.retrieve("gpt-image-1")
+        if engine is not None:
+            # The asyncio engine has its own connection pool
+            engine.warm_up().result(timeout=WARMUP_TIMEOUT)
+        metrics.record_timing("connection_warmup", time.perf_counter() - start)
+    except Exception:
+        # Warm-up is best effort - the real request will surface any error
+        metrics.increment("connection_warmup_failed")
+
+
+def warm_up_connection(client, engine=None):
+    """Warm the shared client's connection, and the asyncio engine's when given, in the background (throttled)"""
+    global _last_warmup
+
+    if client is None:
+        return
+    with _warmup_lock:
+        now = time.monotonic()
+        if now - _last_warmup < WARMUP_INTERVAL:
+            return
+        _last_warmup = now
+    _executor.submit(_warm_up, client, engine)